@@ -0,0 +1,110 @@
+# bench/bench_corrector.py
+"""
+Table-driven corrector vs the original dict-scan implementation.
+Run: python -m bench.bench_corrector
+"""
+import random
+import time
+from collections import Counter
+
+from server import corrector
+from server.corrector import (MAPPING_D1, MAPPING_D2, MAPPING_D3, MAPPING_D4,
+                              MAPPING_D5, MAPPING_D6, MAPPING_D7)
+
+N_STRINGS = 100_000
+CYCLE = 5   # readings per battery, as sent by the client
+
+# ----------------------------------------------------------------
+# original implementation (baseline)
+# ----------------------------------------------------------------
+def legacy_map_by_position(c, pos):
+    c = c.upper()
+    mapping_sets = {
+        0: MAPPING_D1, 1: MAPPING_D2, 2: MAPPING_D3, 3: MAPPING_D4,
+        4: MAPPING_D5, 5: MAPPING_D6, 6: MAPPING_D7,
+    }
+    if pos in [7, 8, 9, 10]:
+        mapping_sets[pos] = MAPPING_D2
+    if pos in mapping_sets:
+        for key, vals in mapping_sets[pos].items():
+            if c == key or c in vals:
+                return key
+    return ""
+
+def legacy_reconstruct_datecode(list_raw):
+    if not list_raw:
+        return ""
+    raw_stats = [Counter() for _ in range(11)]
+    for txt in list_raw:
+        t = ''.join(k for k in txt.upper() if k.isalnum())[:11]
+        for i, ch in enumerate(t):
+            raw_stats[i][ch] += 1
+    per_pos = [[] for _ in range(11)]
+    for txt in list_raw:
+        t = ''.join(k for k in txt.upper() if k.isalnum())[:11]
+        for i in range(len(t)):
+            mapped = legacy_map_by_position(t[i], i)
+            if mapped:
+                per_pos[i].append(mapped)
+    result = ""
+    for i in range(11):
+        if per_pos[i]:
+            result += Counter(per_pos[i]).most_common(1)[0][0]
+        else:
+            if i in [7, 8, 9, 10] and raw_stats[i]:
+                result += raw_stats[i].most_common(1)[0][0]
+            elif i == 0: result += '1'
+            elif i == 6: result += 'D'
+            elif i == 4: result += 'A'
+            elif i == 5: result += '1'
+            else:
+                result += '0'
+    return result
+
+# ----------------------------------------------------------------
+# synthetic OCR strings
+# ----------------------------------------------------------------
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+
+def synthetic_readings(n, seed=0):
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        length = rng.randint(6, 14)
+        s = "".join(rng.choice(ALPHABET) for _ in range(length))
+        if rng.random() < 0.2:
+            s = s[:3] + rng.choice(" -.:") + s[3:].lower()
+        out.append(s)
+    return out
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+def main():
+    readings = synthetic_readings(N_STRINGS)
+    chunks = [readings[i:i + CYCLE] for i in range(0, len(readings), CYCLE)]
+    print(f"{N_STRINGS} synthetic OCR strings ({len(chunks)} cycles of {CYCLE})\n")
+
+    # 1. per-character mapping
+    chars = [(ch, i) for s in readings for i, ch in enumerate(corrector.normalize(s))]
+    old, t_old = timed(lambda: [legacy_map_by_position(c, p) for c, p in chars])
+    new, t_new = timed(lambda: [corrector.map_by_position(c, p) for c, p in chars])
+    assert old == new
+    print(f"map_by_position      {t_old:8.3f}s -> {t_new:8.3f}s  x{t_old / t_new:.1f}")
+
+    # 2. per-cycle reconstruction (the /inspect workload)
+    old, t_old = timed(lambda: [legacy_reconstruct_datecode(c) for c in chunks])
+    new, t_new = timed(lambda: [corrector.reconstruct_datecode(c) for c in chunks])
+    assert old == new
+    print(f"reconstruct x{len(chunks):<7} {t_old:8.3f}s -> {t_new:8.3f}s  x{t_old / t_new:.1f}")
+
+    # 3. one vote over every reading (vectorized path)
+    old, t_old = timed(legacy_reconstruct_datecode, readings)
+    new, t_new = timed(corrector.reconstruct_datecode, readings)
+    assert old == new
+    print(f"reconstruct (100k)   {t_old:8.3f}s -> {t_new:8.3f}s  x{t_old / t_new:.1f}")
+
+if __name__ == "__main__":
+    main()
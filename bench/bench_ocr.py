@@ -0,0 +1,90 @@
+# bench/bench_ocr.py
+"""
+Latency / agreement of the recognition-only OCR modes against readtext.
+Run on a folder of real captures: python -m bench.bench_ocr <image_dir>
+
+Cover and ROI detection run once; every mode then reads the same
+preprocessed ROIs. Agreement is measured against the current batched
+readtext path (first row): "text" compares the raw strings, "datecode"
+compares them after reconstruct_datecode.
+"""
+import sys
+import time
+
+from server.vision_engine import VisionEngine, OCR_ALLOWLIST, pixel_boxes, top_box
+from server.recognizers import EasyOCRRecognizer, CTCRecognizer, OCR_CTC_MODEL
+from server.corrector import reconstruct_datecode
+from bench.bench_transport import load_images
+
+REPEAT = 3
+
+def collect_rois(engine, images):
+    """Preprocessed ROI of every cover box, exactly as _process_batch builds them."""
+    rois = []
+    for img, r in zip(images, engine.model(images, verbose=False, device='cpu')):
+        crops = []
+        for x1, y1, x2, y2 in pixel_boxes(r.boxes.xyxy.cpu().numpy(), img.shape):
+            crop = img[y1:y2, x1:x2]
+            if crop.size: crops.append(crop)
+        if not crops: continue
+        for crop, rr in zip(crops, engine.roi_model(crops, verbose=False, device='cpu')):
+            box = top_box(rr, crop.shape)
+            if box is None: continue
+            rx1, ry1, rx2, ry2 = box
+            # one buffer slot per ROI: they are all read after collection
+            prepped = engine.simple_preprocess(crop[ry1:ry2, rx1:rx2], len(rois))
+            if prepped is not None: rois.append(prepped)
+    return rois
+
+def timed(fn, rois):
+    fn(rois)    # warm-up
+    t0 = time.perf_counter()
+    for _ in range(REPEAT):
+        texts = fn(rois)
+    return texts, (time.perf_counter() - t0) * 1000 / (REPEAT * len(rois))
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    images = load_images(sys.argv[1])
+    if not images:
+        sys.exit(f"no images in {sys.argv[1]}")
+
+    engine = VisionEngine()
+    engine.recognizer = None        # read_batch = readtext_batched reference
+    engine.ocr_cache = None         # time every mode on every ROI
+    rois = collect_rois(engine, images)
+    if not rois:
+        sys.exit("no ROIs detected")
+
+    def readtext_single(batch):
+        out = []
+        for roi in batch:
+            res = engine.reader.readtext(roi, allowlist=OCR_ALLOWLIST)
+            out.append("".join(r[1] for r in res).replace(" ", "") if res else None)
+        return out
+
+    modes = [("readtext batched (current)", engine.read_batch),
+             ("readtext per ROI", readtext_single)]
+    recognizer = EasyOCRRecognizer(engine.reader, OCR_ALLOWLIST)
+    modes.append(("recognize batched", lambda b: [t for t, _ in recognizer.recognize(b)]))
+    if OCR_CTC_MODEL:
+        ctc = CTCRecognizer(OCR_CTC_MODEL, OCR_ALLOWLIST)
+        modes.append(("ctc batched", lambda b: [t for t, _ in ctc.recognize(b)]))
+
+    print(f"{len(images)} images, {len(rois)} ROIs\n")
+    print(f"{'mode':<28}{'ms/ROI':>9}{'text':>8}{'datecode':>10}{'empty':>8}")
+    reference = None
+    for name, fn in modes:
+        texts, ms = timed(fn, rois)
+        codes = [reconstruct_datecode([t]) if t else None for t in texts]
+        if reference is None:
+            reference = (texts, codes)
+        text_ok = sum(a == b for a, b in zip(texts, reference[0])) / len(rois)
+        code_ok = sum(a == b for a, b in zip(codes, reference[1])) / len(rois)
+        empty = sum(t is None for t in texts) / len(rois)
+        print(f"{name:<28}{ms:>9.1f}{text_ok:>8.0%}{code_ok:>10.0%}{empty:>8.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# bench/bench_transport.py
+"""
+Payload size / server decode time / OCR agreement per client transport setting.
+Run on a folder of real captures: python -m bench.bench_transport <image_dir>
+
+OCR agreement is measured against the reading of the untouched image, so the
+first row (current default) is the reference and should show 100%.
+"""
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from client.codec import FrameCodec
+from server.vision_engine import VisionEngine
+from server.corrector import reconstruct_datecode
+
+VARIANTS = [
+    ("jpg q95 (current)", dict(fmt="jpg", quality=95)),
+    ("jpg q80",           dict(fmt="jpg", quality=80)),
+    ("jpg q60",           dict(fmt="jpg", quality=60)),
+    ("gray jpg q80",      dict(fmt="jpg", quality=80, gray=True)),
+    ("jpg q80 x0.75",     dict(fmt="jpg", quality=80, scale=0.75)),
+    ("jpg q80 x0.5",      dict(fmt="jpg", quality=80, scale=0.5)),
+    ("webp q80",          dict(fmt="webp", quality=80)),
+    ("png 3",             dict(fmt="png", quality=3)),
+    # wide box around the stop position of refs/tes_server.py is_box_in_region
+    ("region jpg q90",    dict(fmt="jpg", quality=90, region=(0.35, 0.25, 0.85, 0.80))),
+]
+
+def load_images(folder):
+    names = sorted(f for f in os.listdir(folder) if f.lower().endswith((".jpg", ".jpeg", ".png", ".bmp")))
+    images = [cv2.imread(os.path.join(folder, n)) for n in names]
+    return [img for img in images if img is not None]
+
+def read_datecodes(vision, frames):
+    return [reconstruct_datecode([text]) if text else None for text, _ in vision.process_batch(frames)]
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    images = load_images(sys.argv[1])
+    if not images:
+        sys.exit(f"no images in {sys.argv[1]}")
+
+    vision = VisionEngine()
+    vision.ocr_cache = None     # every variant is read, not served from the reference pass
+    reference = read_datecodes(vision, images)
+    readable = sum(r is not None for r in reference)
+    print(f"{len(images)} images, {readable} readable at full quality\n")
+    print(f"{'variant':<20}{'KB/frame':>10}{'decode ms':>11}{'agree':>8}")
+
+    for name, opts in VARIANTS:
+        codec = FrameCodec(**opts)
+        try:
+            payloads = [codec.encode(img)[0] for img in images]
+        except (ValueError, cv2.error) as e:
+            print(f"{name:<20} unsupported here ({e})")
+            continue
+
+        t0 = time.perf_counter()
+        decoded = [cv2.imdecode(np.frombuffer(p, np.uint8), cv2.IMREAD_COLOR) for p in payloads]
+        decode_ms = (time.perf_counter() - t0) / len(payloads) * 1000
+
+        readings = read_datecodes(vision, decoded)
+        agree = sum(r == ref for r, ref in zip(readings, reference) if ref is not None)
+        kb = sum(len(p) for p in payloads) / len(payloads) / 1024
+        pct = agree / readable * 100 if readable else 0.0
+        print(f"{name:<20}{kb:>10.1f}{decode_ms:>11.2f}{pct:>7.0f}%")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# bench/bench_yolo_backend.py
+"""
+Box parity and speed of the ONNX Runtime YOLO backend against PyTorch.
+Run on a folder of real captures: python -m bench.bench_yolo_backend <image_dir>
+
+Cover boxes are compared on the full frames, ROI boxes on the PyTorch cover
+crops, so both backends see identical ROI inputs. A box matches when the
+class agrees and IoU >= MATCH_IOU; "max px" is the largest corner offset of
+a matched box. PyTorch is the reference row.
+
+The ONNX rows load through ONNX Runtime only (no PyTorch fallback), and the
+run exits non-zero when a row fails to load, matches fewer than its
+min_matched share of the reference boxes or adds more extra boxes than
+the remaining share.
+"""
+import sys
+import time
+
+import numpy as np
+
+from common.config import MODEL_PATH, ROI_MODEL_PATH
+from server.yolo_backend import load_yolo, _load_onnx
+from bench.bench_transport import load_images
+
+MATCH_IOU = 0.95
+
+# (name, loader, min matched share of the reference boxes)
+BACKENDS = [
+    ("torch (current)", lambda w: load_yolo(w, backend="torch"), 1.0),
+    ("onnx fp32",       lambda w: _load_onnx(w, int8=False),     1.0),
+    ("onnx int8",       lambda w: _load_onnx(w, int8=True),      0.98),
+]
+
+def boxes_of(results):
+    return [(r.boxes.xyxy.cpu().numpy(), r.boxes.cls.cpu().numpy()) for r in results]
+
+def iou(a, b):
+    x1, y1 = np.maximum(a[:2], b[:2])
+    x2, y2 = np.minimum(a[2:], b[2:])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+def compare(ref, out):
+    """(matched, reference total, extra boxes, max corner offset in px)"""
+    matched = total = extra = 0
+    max_px = 0.0
+    for (rb, rc), (ob, oc) in zip(ref, out):
+        total += len(rb)
+        used = set()
+        for box, cls in zip(rb, rc):
+            best, best_j = 0.0, None
+            for j, (other, ocls) in enumerate(zip(ob, oc)):
+                if j in used or ocls != cls: continue
+                score = iou(box, other)
+                if score > best: best, best_j = score, j
+            if best_j is not None and best >= MATCH_IOU:
+                matched += 1
+                used.add(best_j)
+                max_px = max(max_px, float(np.abs(box - ob[best_j]).max()))
+        extra += len(ob) - len(used)
+    return matched, total, extra, max_px
+
+def run(model, images):
+    model(images[:1], verbose=False, device='cpu')      # warm-up
+    t0 = time.perf_counter()
+    results = model(images, verbose=False, device='cpu')
+    return boxes_of(results), (time.perf_counter() - t0) * 1000 / len(images)
+
+def crops_of(images, cover_boxes):
+    crops = []
+    for img, (boxes, _) in zip(images, cover_boxes):
+        for x1, y1, x2, y2 in boxes.astype(int):
+            crop = img[y1:y2, x1:x2]
+            if crop.size: crops.append(crop)
+    return crops
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    images = load_images(sys.argv[1])
+    if not images:
+        sys.exit(f"no images in {sys.argv[1]}")
+
+    reference = None
+    failed = []
+    print(f"{len(images)} images\n")
+    print(f"{'backend':<18}{'model':<7}{'ms/img':>9}{'matched':>12}{'extra':>7}{'max px':>8}{'parity':>8}")
+    for name, loader, min_matched in BACKENDS:
+        try:
+            cover, roi = loader(MODEL_PATH), loader(ROI_MODEL_PATH)
+        except Exception as e:
+            if reference is None:
+                sys.exit(f"reference backend {name} failed to load: {e}")
+            print(f"{name:<18}failed to load: {e}")
+            failed.append(name)
+            continue
+        cover_boxes, cover_ms = run(cover, images)
+        if reference is None:
+            crops = crops_of(images, cover_boxes)
+        roi_boxes, roi_ms = run(roi, crops) if crops else ([], 0.0)
+        if reference is None:
+            reference = (cover_boxes, roi_boxes)
+
+        for label, ms, ref, out in (("cover", cover_ms, reference[0], cover_boxes),
+                                    ("roi", roi_ms, reference[1], roi_boxes)):
+            matched, total, extra, max_px = compare(ref, out)
+            ok = matched >= min_matched * total and extra <= (1 - min_matched) * total
+            if not ok:
+                failed.append(f"{name} {label}")
+            print(f"{name:<18}{label:<7}{ms:>9.1f}{f'{matched}/{total}':>12}{extra:>7}{max_px:>8.1f}"
+                  f"{'ok' if ok else 'FAIL':>8}")
+
+    if failed:
+        sys.exit(f"\nparity check failed: {', '.join(failed)}")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,12 @@
 # client/camera.py
+import sys
 import cv2
+import numpy as np
 import threading
 import time
+from collections import deque
+from contextlib import contextmanager
+import common.config as config
 
 try:
     import av
@@ -10,21 +15,187 @@ except ImportError:
     av = None
     _HAS_PYAV = False
 
-class MagnusCamera:
-    def __init__(self, device_name="UVC Camera", width=1280, height=720, fps="30", high_fps_mode=False):
-        if not _HAS_PYAV:
-            print("❌ PyAV not installed. Using OpenCV fallback.")
-            self.cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-            self.cap.set(3, width)
-            self.cap.set(4, height)
-            self.use_pyav = False
+RING_SLOTS = 4      # latest + one being written + room for pinned readers
+
+# dshow (Windows) | v4l2 (Linux) | file (looped video, for testing) | opencv
+CAMERA_BACKEND = getattr(config, "CAMERA_BACKEND", "dshow" if sys.platform == "win32" else "v4l2")
+# dshow device name, /dev/videoN or a video file path; None = backend default
+CAMERA_DEVICE  = getattr(config, "CAMERA_DEVICE", None)
+
+# Keep the camera's MJPEG packets and decode only what is asked for (PyAV only)
+CAMERA_DEFERRED_DECODE = getattr(config, "CAMERA_DEFERRED_DECODE", False)
+# Preview decode scale in deferred mode: libjpeg DCT scaling by 1/2, 1/4 or 1/8
+PREVIEW_REDUCE = getattr(config, "PREVIEW_REDUCE", 2)
+
+_DEFAULT_DEVICE = {"dshow": "UVC Camera", "v4l2": "/dev/video0", "opencv": 0}
+_REDUCED = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+            4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+class FrameRing:
+    """
+    Preallocated frame slots with sequence numbers. The reader thread writes
+    into a free slot and publishes it; consumers pin a slot and get a
+    read-only view, so nothing is copied unless the caller keeps the frame.
+    The writer never touches the latest or a pinned slot.
+    """
+    def __init__(self, shape, slots=RING_SLOTS):
+        self.buf = np.empty((slots, *shape), dtype=np.uint8)
+        self.seqs = [0] * slots
+        self.pins = [0] * slots
+        self.latest = None          # slot index of the newest frame
+        self.seq = 0                # sequence number of the newest frame
+        self.dropped = 0            # frames skipped because every slot was pinned
+        self.cond = threading.Condition()
+
+    def reserve(self):
+        """Free slot index for the writer, or None (drop this frame)."""
+        with self.cond:
+            for k in range(len(self.pins)):
+                if k != self.latest and self.pins[k] == 0:
+                    return k
+            self.dropped += 1
+            return None
+
+    def publish(self, k):
+        with self.cond:
+            self.seq += 1
+            self.seqs[k] = self.seq
+            self.latest = k
+            self.cond.notify_all()
+
+    @contextmanager
+    def pin(self, after=0, timeout=1.0):
+        """
+        Yields (seq, read-only view) of the newest frame with seq > after,
+        or (after, None) on timeout. The view is only valid inside the block.
+        """
+        with self.cond:
+            k = self.latest if self.cond.wait_for(lambda: self.seq > after, timeout) else None
+            if k is not None:
+                self.pins[k] += 1
+                seq = self.seqs[k]
+        if k is None:
+            yield after, None
             return
+        try:
+            view = self.buf[k].view()
+            view.flags.writeable = False
+            yield seq, view
+        finally:
+            with self.cond:
+                self.pins[k] -= 1
+
+
+class PacketRing:
+    """Last few compressed frames (bytes) with sequence numbers; bytes are immutable, so no pinning."""
+    def __init__(self, slots=RING_SLOTS):
+        self.packets = deque(maxlen=slots)
+        self.seq = 0
+        self.cond = threading.Condition()
 
-        self.use_pyav = True
+    def publish(self, data):
+        with self.cond:
+            self.seq += 1
+            self.packets.append((self.seq, data))
+            self.cond.notify_all()
+
+    def latest(self, after=0, timeout=1.0):
+        """(seq, bytes) of the newest packet with seq > after, or (after, None) on timeout."""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq > after, timeout):
+                return after, None
+            return self.packets[-1]
+
+
+def _complete_jpeg(data):
+    """MJPEG from some cameras omits the Huffman tables; only forward self-contained JPEGs."""
+    sos = data.find(b"\xff\xda")
+    return sos != -1 and data.find(b"\xff\xc4", 0, sos) != -1
+
+
+class MagnusCamera:
+    """
+    Capture thread feeding a FrameRing. PyAV reads MJPEG from dshow or v4l2
+    (or loops a video file); OpenCV is the fallback. Every path decodes into
+    the ring's preallocated slots.
+
+    With deferred=True (PyAV + MJPEG only) the thread just keeps the
+    compressed packets in a PacketRing: captures decode full size on
+    request and can forward the camera's own JPEG bytes, the preview
+    decodes at 1/PREVIEW_REDUCE size.
+    """
+    def __init__(self, device_name=CAMERA_DEVICE, width=1280, height=720, fps="30",
+                 high_fps_mode=False, backend=CAMERA_BACKEND, deferred=CAMERA_DEFERRED_DECODE):
+        if backend not in ("dshow", "v4l2", "file", "opencv"):
+            raise ValueError(f"unknown camera backend {backend!r}")
+        if device_name is None:
+            device_name = _DEFAULT_DEVICE.get(backend)
+        if backend == "file" and device_name is None:
+            raise ValueError("CAMERA_DEVICE must name a video file for the file backend")
+
+        self.backend = backend
         self.device_name = device_name
         self.running = True
-        self.latest_frame = None
-        
+        self.ring = FrameRing((height, width, 3))
+        self.use_pyav = backend != "opencv" and _HAS_PYAV
+        self.info = {"backend": backend, "device": device_name, "width": None, "height": None,
+                     "fps": None, "codec": None}
+        self.timing = {"frames": 0, "interval_ms": None, "latency_ms": None}
+        self.last_arrival = None
+        self.packets = None
+        self.decodes = 0
+
+        if backend != "opencv" and not _HAS_PYAV:
+            print("❌ PyAV not installed. Using OpenCV fallback.")
+
+        if self.use_pyav:
+            try:
+                self.container = self._open_pyav(width, height, fps, high_fps_mode)
+                stream = self.container.streams.video[0]
+                rate = stream.average_rate or stream.guessed_rate
+                self.info.update(width=stream.codec_context.width, height=stream.codec_context.height,
+                                 fps=float(rate) if rate else None, codec=stream.codec_context.name)
+            except Exception as e:
+                print(f"MagnusCamera Init Failed: {e}. Fallback to OpenCV.")
+                self.use_pyav = False
+
+        if deferred and self.use_pyav:
+            if self.info["codec"] == "mjpeg":
+                self.packets = PacketRing()
+            else:
+                print(f"⚠️ Deferred decode needs MJPEG, camera gives {self.info['codec']}")
+
+        if not self.use_pyav:
+            self.cap = self._open_opencv(width, height, fps)
+            self.info.update(backend=f"opencv/{backend}",
+                             width=int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                             height=int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                             fps=self.cap.get(cv2.CAP_PROP_FPS) or None)
+
+        i = self.info
+        print(f"📷 Camera: {i['backend']} {i['device']} {i['width']}x{i['height']} @ {i['fps']} fps"
+              + (f" ({i['codec']})" if i["codec"] else "") + (", deferred decode" if self.packets else ""))
+
+        if self.packets is not None:
+            target = self._packet_loop
+        else:
+            target = self._pyav_loop if self.use_pyav else self._opencv_loop
+        self.thread = threading.Thread(target=target, daemon=True)
+        self.thread.start()
+
+    def _open_pyav(self, width, height, fps, high_fps_mode):
+        if self.backend == "file":
+            return av.open(self.device_name)
+        if self.backend == "v4l2":
+            options = {
+                "video_size": f"{width}x{height}",
+                "framerate": str(fps),
+                "input_format": "mjpeg",
+                "fflags": "nobuffer",
+                "ts": "mono2abs",       # kernel timestamps on the wall clock, for latency
+            }
+            return av.open(self.device_name, format="v4l2", options=options)
         rtbuf = "50M" if not high_fps_mode else "10M"
         options = {
             "video_size": f"{width}x{height}",
@@ -33,29 +204,178 @@ class MagnusCamera:
             "fflags": "nobuffer",
             "rtbufsize": rtbuf,
         }
-        
+        return av.open(f"video={self.device_name}", format="dshow", options=options)
+
+    def _open_opencv(self, width, height, fps):
+        if self.backend == "file":
+            return cv2.VideoCapture(self.device_name)
+        index = self.device_name if isinstance(self.device_name, int) else 0
+        if isinstance(self.device_name, str) and self.device_name.startswith("/dev/video"):
+            index = int(self.device_name[len("/dev/video"):] or 0)
+        api = cv2.CAP_DSHOW if sys.platform == "win32" else cv2.CAP_V4L2
+        cap = cv2.VideoCapture(index, api)
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        cap.set(cv2.CAP_PROP_FPS, float(fps))
+        return cap
+
+    def _measure(self, captured_at=None):
+        """Frame interval and, when the source stamps frames on the wall clock, capture latency."""
+        now = time.time()
+        t = self.timing
+        t["frames"] += 1
+        if self.last_arrival is not None:
+            t["interval_ms"] = _ema(t["interval_ms"], (now - self.last_arrival) * 1000)
+        self.last_arrival = now
+        if captured_at is not None and 0 <= now - captured_at < 5:
+            t["latency_ms"] = _ema(t["latency_ms"], (now - captured_at) * 1000)
+
+    def _store(self, src):
+        """Copies a decoded frame into a free ring slot and publishes it."""
+        if src.shape != self.ring.buf.shape[1:]:
+            # camera negotiated another size: reallocate once, keep numbering
+            ring = FrameRing(src.shape)
+            ring.seq = self.ring.seq
+            self.ring = ring
+        k = self.ring.reserve()
+        if k is None:
+            return
+        np.copyto(self.ring.buf[k], src)
+        self.ring.publish(k)
+
+    def _pyav_loop(self):
+        looping = self.backend == "file"
+        period = 1.0 / (self.info["fps"] or 30.0)
         try:
-            self.container = av.open(f"video={device_name}", format="dshow", options=options)
-            self.thread = threading.Thread(target=self._reader_loop, daemon=True)
-            self.thread.start()
-        except Exception as e:
-            print(f"MagnusCamera Init Failed: {e}. Fallback to OpenCV.")
-            self.use_pyav = False
-            self.cap = cv2.VideoCapture(0)
-
-    def _reader_loop(self):
+            while self.running:
+                due = time.monotonic()
+                for frame in self.container.decode(video=0):
+                    if not self.running: break
+                    if looping:
+                        # play the file back at its own frame rate
+                        due += period
+                        time.sleep(max(0.0, due - time.monotonic()))
+                    # bgr24 into PyAV's own buffer, then one copy into the ring
+                    rgb = frame.reformat(format="bgr24")
+                    plane = rgb.planes[0]
+                    w = rgb.width
+                    src = np.frombuffer(plane, np.uint8).reshape(rgb.height, plane.line_size)
+                    self._store(src[:, :w * 3].reshape(rgb.height, w, 3))
+                    self._measure(None if looping else frame.time)
+                if not looping: break
+                self.container.seek(0)
+        except: self.running = False
+
+    def _packet_loop(self):
+        looping = self.backend == "file"
+        period = 1.0 / (self.info["fps"] or 30.0)
         try:
-            for frame in self.container.decode(video=0):
-                if not self.running: break
-                self.latest_frame = frame.to_ndarray(format="bgr24")
+            while self.running:
+                due = time.monotonic()
+                for packet in self.container.demux(video=0):
+                    if not self.running: break
+                    if packet.size == 0: continue       # demuxer flush packet
+                    if looping:
+                        due += period
+                        time.sleep(max(0.0, due - time.monotonic()))
+                    self.packets.publish(bytes(packet))
+                    stamp = None
+                    if not looping and packet.pts is not None:
+                        stamp = float(packet.pts * packet.time_base)
+                    self._measure(stamp)
+                if not looping: break
+                self.container.seek(0)
         except: self.running = False
 
+    def _decode(self, data, reduce=1):
+        self.decodes += 1
+        return cv2.imdecode(np.frombuffer(data, np.uint8), _REDUCED.get(reduce, cv2.IMREAD_COLOR))
+
+    def _opencv_loop(self):
+        looping = self.backend == "file"
+        period = 1.0 / (self.info["fps"] or 30.0)
+        while self.running:
+            k = self.ring.reserve()
+            if k is None:
+                time.sleep(0.005)
+                continue
+            slot = self.ring.buf[k]
+            ok, out = self.cap.read(slot)
+            if not ok or out is None:
+                if looping:
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                time.sleep(0.01)
+                continue
+            if out is slot or np.shares_memory(out, slot):
+                self.ring.publish(k)    # decoded straight into the slot
+            else:
+                self._store(out)
+            self._measure()
+            if looping:
+                time.sleep(period)
+
+    @property
+    def seq(self):
+        """Sequence number of the newest frame (0 = none yet)."""
+        return self.packets.seq if self.packets is not None else self.ring.seq
+
+    def stats(self):
+        """Negotiated format plus measured frame interval / capture latency (EMA, ms)."""
+        t = self.timing
+        return {
+            **self.info,
+            "frames": t["frames"],
+            "dropped": self.ring.dropped,
+            "decodes": self.decodes if self.packets is not None else t["frames"],
+            "measured_fps": round(1000 / t["interval_ms"], 1) if t["interval_ms"] else None,
+            "interval_ms": round(t["interval_ms"], 2) if t["interval_ms"] else None,
+            "latency_ms": round(t["latency_ms"], 2) if t["latency_ms"] is not None else None,
+        }
+
+    @contextmanager
+    def _decoded(self, after, timeout, reduce=1):
+        seq, data = self.packets.latest(after, timeout)
+        yield seq, (self._decode(data, reduce) if data is not None else None)
+
+    def view(self, after=0, timeout=1.0):
+        """Context manager: (seq, read-only view) of the newest frame, no copy (deferred: one decode)."""
+        if self.packets is not None:
+            return self._decoded(after, timeout)
+        return self.ring.pin(after, timeout)
+
+    def preview(self, after=0, timeout=1.0):
+        """Like view(), but deferred mode decodes at 1/PREVIEW_REDUCE size."""
+        if self.packets is not None:
+            return self._decoded(after, timeout, PREVIEW_REDUCE)
+        return self.ring.pin(after, timeout)
+
+    def next_frame(self, after=0, timeout=1.0):
+        """(seq, private copy) of the newest frame newer than `after`; (after, None) on timeout."""
+        seq, frame, _ = self.next_capture(after, timeout)
+        return seq, frame
+
+    def next_capture(self, after=0, timeout=1.0, decode=True):
+        """
+        (seq, frame, jpeg) for the newest frame newer than `after`. jpeg is
+        the camera's own bytes (deferred mode, complete JPEGs only), else
+        None. With decode=False the frame is only decoded when there are
+        no usable bytes to forward.
+        """
+        if self.packets is None:
+            with self.ring.pin(after, timeout) as (seq, frame):
+                return seq, (frame.copy() if frame is not None else None), None
+        seq, data = self.packets.latest(after, timeout)
+        if data is None:
+            return seq, None, None
+        jpeg = data if _complete_jpeg(data) else None
+        frame = self._decode(data) if decode or jpeg is None else None
+        return seq, frame, jpeg
+
     def read(self):
-        if not self.use_pyav:
-            return self.cap.read()
-        if self.latest_frame is None:
-            return False, None
-        return True, self.latest_frame.copy()
+        """cv2.VideoCapture-style read of the newest frame (a copy the caller owns)."""
+        seq, frame = self.next_frame(0, timeout=0)
+        return frame is not None, frame
 
     def release(self):
         self.running = False
@@ -63,4 +383,9 @@ class MagnusCamera:
             try: self.container.close()
             except: pass
         else:
-            self.cap.release()
\ No newline at end of file
+            self.thread.join(timeout=1.0)
+            self.cap.release()
+
+
+def _ema(prev, value, alpha=0.1):
+    return value if prev is None else prev + alpha * (value - prev)
@@ -0,0 +1,73 @@
+# client/codec.py
+import cv2
+import common.config as config
+
+# Defaults reproduce the old behaviour: full colour 1280x720 JPEG at quality 95
+TRANSPORT_FORMAT  = getattr(config, "TRANSPORT_FORMAT", "jpg")    # jpg | webp | png
+TRANSPORT_QUALITY = getattr(config, "TRANSPORT_QUALITY", 95)      # jpg/webp 1-100, png 0-9
+TRANSPORT_GRAY    = getattr(config, "TRANSPORT_GRAY", False)
+TRANSPORT_SCALE   = getattr(config, "TRANSPORT_SCALE", 1.0)       # < 1.0 downscales
+# Fixed crop as frame fractions (x1, y1, x2, y2), e.g. around the battery stop
+# position used by is_box_in_region in refs/tes_server.py. None = full frame.
+TRANSPORT_REGION  = getattr(config, "TRANSPORT_REGION", None)
+
+_MIME = {"jpg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+
+
+class FrameCodec:
+    """Turns a BGR frame into the bytes sent to /inspect (crop -> gray -> scale -> encode)."""
+    def __init__(self, fmt=TRANSPORT_FORMAT, quality=TRANSPORT_QUALITY, gray=TRANSPORT_GRAY,
+                 scale=TRANSPORT_SCALE, region=TRANSPORT_REGION):
+        self.fmt = fmt
+        self.quality = quality
+        self.gray = gray
+        self.scale = scale
+        self.region = region
+
+    def negotiate(self, caps):
+        """Drops whatever the server's /capabilities doesn't accept."""
+        if not caps:
+            return self
+        if self.fmt not in caps.get("formats", ["jpg"]):
+            print(f"⚠️ Server can't decode {self.fmt}, sending jpg")
+            self.fmt = "jpg"
+            self.quality = min(100, max(1, self.quality if self.quality > 9 else 95))
+        if self.gray and not caps.get("gray", False):
+            self.gray = False
+        return self
+
+    def prepare(self, frame):
+        if self.region:
+            h, w = frame.shape[:2]
+            x1, y1, x2, y2 = self.region
+            frame = frame[int(h * y1):int(h * y2), int(w * x1):int(w * x2)]
+        if self.gray and frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.scale and self.scale != 1.0:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return frame
+
+    @property
+    def passthrough(self):
+        """True when the camera's own JPEG bytes can be sent as they are."""
+        return self.fmt == "jpg" and not self.region and not self.gray and self.scale in (None, 1.0)
+
+    def encode(self, frame, original=None):
+        """
+        Returns (bytes, filename extension, mime type). `original` is the
+        camera's JPEG for this frame; it is sent untouched (camera quality,
+        no re-encode) when no transform applies, and frame may then be None.
+        """
+        if original is not None and self.passthrough:
+            return original, "jpg", _MIME["jpg"]
+        img = self.prepare(frame)
+        if self.fmt == "webp":
+            params = [cv2.IMWRITE_WEBP_QUALITY, int(self.quality)]
+        elif self.fmt == "png":
+            params = [cv2.IMWRITE_PNG_COMPRESSION, int(self.quality)]
+        else:
+            params = [cv2.IMWRITE_JPEG_QUALITY, int(self.quality)]
+        ok, enc = cv2.imencode(f".{self.fmt}", img, params)
+        if not ok:
+            raise ValueError(f"could not encode frame as {self.fmt}")
+        return enc.tobytes(), self.fmt, _MIME[self.fmt]
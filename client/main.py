@@ -3,11 +3,32 @@ from tkinter import Label
 from PIL import Image, ImageTk
 import threading
 import time
+import queue
 import cv2
+from concurrent.futures import ThreadPoolExecutor
 import client.network as net  # Requires the network.py created previously
 from client.camera import MagnusCamera
+from client.prefilter import FrameGate
+import common.config as config
 from common.config import CAPTURE_COUNT, CAPTURE_INTERVAL, PLC_SCAN_RATE
 
+# Send frames while capturing and stop once the server vote is settled
+STREAM_INSPECT = getattr(config, "STREAM_INSPECT", False)
+# Wait for server-pushed triggers on /plc/events instead of polling /plc/input
+PLC_PUSH = getattr(config, "PLC_PUSH", False)
+# Drop empty/blurred/repeated frames on the client; in batch mode capture a
+# burst of PREFILTER_BURST frames and send the sharpest CAPTURE_COUNT
+PREFILTER          = getattr(config, "PREFILTER", False)
+PREFILTER_BURST    = getattr(config, "PREFILTER_BURST", CAPTURE_COUNT * 2)
+PREFILTER_INTERVAL = getattr(config, "PREFILTER_INTERVAL", CAPTURE_INTERVAL / 2)
+# Camera preview rate; lower while a cycle runs so capture/network get the CPU
+PREVIEW_FPS      = getattr(config, "PREVIEW_FPS", 15)
+PREVIEW_BUSY_FPS = getattr(config, "PREVIEW_BUSY_FPS", 5)
+# Capture -> inspect -> DB write as separate stages joined by bounded queues,
+# so the next battery can be captured while the previous one is still in OCR
+PIPELINE       = getattr(config, "PIPELINE", False)
+PIPELINE_DEPTH = getattr(config, "PIPELINE_DEPTH", 2)
+
 class BatteryApp:
     def __init__(self, root):
         self.root = root
@@ -43,6 +64,9 @@ class BatteryApp:
 
         self.video_label = tk.Label(self.video_frame, bg="black")
         self.video_label.pack(fill="both", expand=True)
+        # Label size cached on the Tk thread; the preview thread never calls winfo
+        self.preview_size = (0, 0)
+        self.video_label.bind("<Configure>", self.on_preview_resize)
 
         # Final Result Box
         self.final_box = tk.Label(
@@ -113,12 +137,18 @@ class BatteryApp:
             self.cap = MagnusCamera(high_fps_mode=True)
         except Exception as e:
             print("MagnusCamera failed, using CV2:", e)
-            self.cap = cv2.VideoCapture(0)
+            self.cap = MagnusCamera(high_fps_mode=True, backend="opencv")
 
         self.running = True
         self.is_processing = False
-        self.current_frame = None
+        self.preview_lock = threading.Lock()
+        self.preview_pending = None     # newest rendered-size RGB frame not yet shown
+        self.preview_stats = {"shown": 0, "skipped": 0}
         self.last_input_status = None # For Rising Edge Detection
+        if PIPELINE:
+            # created before any thread starts: busy() reads them from the preview thread
+            self.inspect_queue = queue.Queue(maxsize=PIPELINE_DEPTH)
+            self.db_queue = queue.Queue(maxsize=PIPELINE_DEPTH)
 
         # =====================================================
         # 🔹 THREADS
@@ -126,7 +156,13 @@ class BatteryApp:
         # 1. UI Update Loop (Camera Feed)
         threading.Thread(target=self.gui_update_loop, daemon=True).start()
         
-        # 2. PLC Logic Loop (The Brain)
+        # 2. Inspect and DB write stages (PIPELINE)
+        if PIPELINE:
+            threading.Thread(target=self.stage_loop, args=(self.inspect_queue, self.inspect_stage, self.db_queue),
+                             daemon=True).start()
+            threading.Thread(target=self.stage_loop, args=(self.db_queue, self.write_stage), daemon=True).start()
+
+        # 3. PLC Logic Loop (The Brain)
         threading.Thread(target=self.plc_logic_loop, daemon=True).start()
 
     def resize_with_aspect_ratio_no_upscale(self, image, max_w, max_h):
@@ -143,32 +179,47 @@ class BatteryApp:
             new_w = int(round(new_h * aspect))
         return cv2.resize(image, (max(1, new_w), max(1, new_h)), interpolation=cv2.INTER_AREA)
 
+    def on_preview_resize(self, event):
+        self.preview_size = (event.width, event.height)
+
     def gui_update_loop(self):
-        """Standard loop to keep the UI responsive and showing video"""
+        """
+        Prepares preview frames at PREVIEW_FPS (PREVIEW_BUSY_FPS while busy()).
+        Only one frame is ever waiting for Tk: if the last one wasn't shown
+        yet it is replaced, so a slow Tk loop skips frames instead of queueing.
+        """
+        seq = 0
+        due = time.monotonic()
         while self.running:
-            ret, frame = self.cap.read()
-            if ret and frame is not None:
-                self.current_frame = frame.copy()
-                
-                # Update UI Image
-                try:
-                    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    w = self.video_label.winfo_width()
-                    h = self.video_label.winfo_height()
-                    
-                    if w > 10 and h > 10:
-                        resized = self.resize_with_aspect_ratio_no_upscale(rgb, w, h)
-                        img = ImageTk.PhotoImage(Image.fromarray(resized))
-                        
-                        # Use lambda to update safely on main thread
-                        self.root.after(0, lambda i=img: self.update_video_label(i))
-                except Exception:
-                    pass
-            time.sleep(0.03) # ~30 FPS UI update
-
-    def update_video_label(self, img):
+            fps = PREVIEW_BUSY_FPS if self.busy() else PREVIEW_FPS
+            due = max(due + 1.0 / fps, time.monotonic())
+            w, h = self.preview_size
+            if w > 10 and h > 10:
+                # Pinned view (or reduced decode) of the newest frame; resize
+                # before cvtColor so the colour conversion runs on the small image
+                with self.cap.preview(seq) as (seq, frame):
+                    small = self.resize_with_aspect_ratio_no_upscale(frame, w, h) if frame is not None else None
+                if small is not None:
+                    rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+                    with self.preview_lock:
+                        idle = self.preview_pending is None
+                        if not idle:
+                            self.preview_stats["skipped"] += 1
+                        self.preview_pending = rgb
+                    if idle:
+                        self.root.after(0, self.update_video_label)
+            time.sleep(max(0.0, due - time.monotonic()))
+
+    def update_video_label(self):
+        """Tk thread: shows the newest pending preview frame."""
+        with self.preview_lock:
+            rgb, self.preview_pending = self.preview_pending, None
+        if rgb is None:
+            return
+        img = ImageTk.PhotoImage(Image.fromarray(rgb))
         self.video_label.configure(image=img)
         self.video_label.imgtk = img
+        self.preview_stats["shown"] += 1
 
     def plc_logic_loop(self):
         """
@@ -176,6 +227,8 @@ class BatteryApp:
         Polls the Server for PLC Input status and triggers logic on Rising Edge (0->1).
         """
         print("✅ PLC Logic Engine Started")
+        if PLC_PUSH:
+            return self.plc_push_loop()
         
         while self.running:
             if not self.is_processing:
@@ -197,34 +250,74 @@ class BatteryApp:
             
             time.sleep(PLC_SCAN_RATE)
 
-    def execute_inspection_cycle(self):
+    def plc_push_loop(self):
+        """Runs a cycle for each trigger the server pushes; reconnects if the stream drops."""
+        while self.running:
+            try:
+                for event in net.subscribe_triggers():
+                    if not self.running: break
+                    if self.is_processing:
+                        print("⚠️ Trigger ignored: previous inspection still running")
+                        continue
+                    print("⚡ Trigger Received (0->1) -> Starting Inspection")
+                    self.is_processing = True
+                    threading.Thread(target=self.execute_inspection_cycle, args=(event,), daemon=True).start()
+            except Exception as e:
+                print("PLC Event Stream Error:", e)
+            time.sleep(1.0)
+
+    def execute_inspection_cycle(self, trigger=None):
         """Orchestrates the entire Capture -> Inspect -> Write DB flow"""
         self.is_processing = True
+        job = self.capture_stage(trigger)
+        if job is None:
+            self.is_processing = False
+            return
+
+        if PIPELINE:
+            # C..G continue on the stage threads; the camera is free for the next battery
+            self.put_stage(self.inspect_queue, job)
+        else:
+            self.write_stage(self.inspect_stage(job))
+
+        time.sleep(1.0) # Short debounce/cooldown
+        self.is_processing = False
+        self.update_info("Menunggu Battery Berhenti")
+
+    def capture_stage(self, trigger=None):
+        """A+B: target row, error code and frames. Returns the cycle's job or None."""
         self.update_info("Mencari Row Pending di DB...")
 
-        # A. Get Target Row and Error Code
-        pending = net.get_pending_row()
+        # A. Get Target Row and Error Code (already attached to pushed triggers)
+        pending = trigger["pending"] if trigger else net.get_pending_row()
         if not pending:
             print("⚠️ No pending row found in DB.")
             self.update_info("DB: Tidak ada row pending.")
-            self.is_processing = False
-            return
+            return None
 
         created_at = pending['created_at']
-        error_code = net.get_error_code()
-
-        # B. Capture Images
-        frames = []
-        for i in range(CAPTURE_COUNT):
-            self.update_info(f"Mengambil foto {i+1}/{CAPTURE_COUNT}...")
-            if self.current_frame is not None:
-                frames.append(self.current_frame.copy())
-            time.sleep(CAPTURE_INTERVAL)
-
-        # C. Send to Server for Vision Processing
-        self.update_info("Memproses OCR ke Server...")
-        result = net.inspect_batch(frames, created_at, error_code)
+        error_code = trigger["error_code"] if trigger else net.get_error_code(created_at)
+        job = {"created_at": created_at, "error_code": error_code}
 
+        if STREAM_INSPECT:
+            # B+C. Capture and stream to Server, stop early when settled
+            job["result"] = self.stream_inspection(created_at, error_code)
+        else:
+            # B. Capture Images
+            job["frames"], job["originals"] = self.capture_burst() if PREFILTER else self.capture_frames()
+        return job
+
+    def inspect_stage(self, job):
+        """C: sends the captured frames to the server (streamed jobs already have a result)."""
+        if "result" not in job:
+            self.update_info("Memproses OCR ke Server...")
+            job["result"] = net.inspect_batch(job.pop("frames"), job["created_at"], job["error_code"],
+                                              job.pop("originals"))
+        return job
+
+    def write_stage(self, job):
+        """D..G: shows the result and writes it to the DB."""
+        result = job["result"]
         if result:
             # D. Parse Results
             dc = result.get("datecode", "NO-DETECT")
@@ -242,15 +335,104 @@ class BatteryApp:
 
             # G. Write Final Result to DB (via Server)
             self.update_info("Menulis hasil ke DB...")
-            net.write_db_result(created_at, dc, status, img_path, txt_path)
+            net.write_db_result(job["created_at"], dc, status, img_path, txt_path)
             
             self.update_info("Selesai.")
         else:
             self.update_info("Server Error / Timeout")
 
-        time.sleep(1.0) # Short debounce/cooldown
-        self.is_processing = False
-        self.update_info("Menunggu Battery Berhenti")
+    def put_stage(self, q, job):
+        """Hands a job to the next stage; blocks (backpressure) while that stage is PIPELINE_DEPTH behind."""
+        if q.full():
+            name = "inspect" if q is self.inspect_queue else "db"
+            print(f"⚠️ Pipeline: {name} stage full, waiting")
+        q.put(job)
+
+    def stage_loop(self, source, stage, sink=None):
+        """Worker thread for one pipeline stage (like worker_loop/db_worker_loop in refs/tes_server.py)."""
+        while self.running:
+            try:
+                job = source.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                job = stage(job)
+                if sink is not None:
+                    self.put_stage(sink, job)
+            except Exception as e:
+                print(f"❌ Pipeline {stage.__name__} error ({job.get('created_at')}): {e}")
+            finally:
+                source.task_done()
+
+    def busy(self):
+        """
+        True while any part of a cycle runs. With PIPELINE, is_processing only
+        covers capture: a job stays unfinished in its queue until its stage has
+        run and handed it on, so the counters also cover inspection and DB writes.
+        """
+        if self.is_processing:
+            return True
+        return PIPELINE and bool(self.inspect_queue.unfinished_tasks or self.db_queue.unfinished_tasks)
+
+    def pipeline_depths(self):
+        """Jobs waiting in front of each stage."""
+        if not PIPELINE:
+            return {}
+        return {"inspect": self.inspect_queue.qsize(), "db": self.db_queue.qsize()}
+
+    def capture_frames(self, count=CAPTURE_COUNT, interval=CAPTURE_INTERVAL, decode=None):
+        """
+        Takes `count` distinct camera frames (by sequence number), `interval`
+        apart. Returns (frames, originals): originals are the camera's JPEG
+        bytes when available, and frames are only decoded when needed.
+        """
+        if decode is None:
+            decode = not net.get_codec().passthrough
+        frames, originals = [], []
+        seq = self.cap.seq
+        for i in range(count):
+            self.update_info(f"Mengambil foto {i+1}/{count}...")
+            seq, frame, jpeg = self.cap.next_capture(seq, decode=decode)
+            if frame is not None or jpeg is not None:
+                frames.append(frame)
+                originals.append(jpeg)
+            time.sleep(interval)
+        return frames, originals
+
+    def capture_burst(self):
+        """Captures PREFILTER_BURST frames and keeps the sharpest CAPTURE_COUNT usable ones."""
+        burst, originals = self.capture_frames(PREFILTER_BURST, PREFILTER_INTERVAL, decode=True)
+        picked = FrameGate().pick(burst, CAPTURE_COUNT)
+        print(f"📷 Prefilter: {len(picked)}/{len(burst)} frames kept")
+        return [burst[i] for i in picked], [originals[i] for i in picked]
+
+    def stream_inspection(self, created_at, error_code):
+        """Sends each frame as it is captured; capture stops once the vote can't change."""
+        settled = threading.Event()
+        sender = ThreadPoolExecutor(max_workers=1)
+        gate = FrameGate() if PREFILTER else None
+        decode = gate is not None or not net.get_codec().passthrough
+
+        def send(frame, jpeg, i):
+            if settled.is_set(): return
+            vote = net.inspect_frame(frame, created_at, CAPTURE_COUNT, jpeg)
+            if vote:
+                self.update_info(f"Foto {i+1}: {vote['datecode']} ({vote['status']})")
+                if vote.get("settled"):
+                    settled.set()
+
+        seq = self.cap.seq
+        for i in range(CAPTURE_COUNT):
+            if settled.is_set(): break
+            self.update_info(f"Mengambil foto {i+1}/{CAPTURE_COUNT}...")
+            seq, frame, jpeg = self.cap.next_capture(seq, decode=decode)
+            if (frame is not None or jpeg is not None) and (gate is None or gate.accept(frame)):
+                sender.submit(send, frame, jpeg, i)
+            if settled.wait(CAPTURE_INTERVAL): break
+
+        sender.shutdown(wait=True)
+        self.update_info("Memproses OCR ke Server...")
+        return net.finish_inspection(created_at, error_code)
 
     def update_stats_ui(self, raw_dates, stats_digit):
         """Updates the detailed statistics boxes on the right panel"""
@@ -277,12 +459,19 @@ class BatteryApp:
         self.root.after(0, lambda: self.digit_box.config(text=dg_txt))
 
     def update_info(self, text):
+        if PIPELINE:
+            depths = self.pipeline_depths()
+            text = f"{text}\n[antrian OCR: {depths['inspect']} | DB: {depths['db']}]"
         self.root.after(0, lambda: self.info_label.config(text=text))
 
     def on_close(self):
         self.running = False
+        print("HTTP latency:", net.latency_stats())
         if hasattr(self, 'cap'):
+            print("Camera:", self.cap.stats(), "preview:", self.preview_stats)
             self.cap.release()
+        if PIPELINE:
+            print("Pipeline queues:", self.pipeline_depths())
         self.root.destroy()
 
 if __name__ == "__main__":
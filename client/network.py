@@ -1,40 +1,162 @@
 # client/network.py
+import json
+import threading
+import time
 import requests
-import cv2
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import common.config as config
 from common.config import API_BASE_URL
+from client.codec import FrameCodec
+
+# ----------------------------------------------------------------
+# shared keep-alive transport (also used by client.plc_handler)
+# ----------------------------------------------------------------
+HTTP_POOL_SIZE = getattr(config, "HTTP_POOL_SIZE", 4)
+HTTP_RETRIES   = getattr(config, "HTTP_RETRIES", 2)
+HTTP_BACKOFF   = getattr(config, "HTTP_BACKOFF", 0.1)
+
+# seconds per endpoint; unknown paths get DEFAULT_TIMEOUT
+TIMEOUTS = {
+    "/plc/input": 1, "/plc/pending": 1, "/plc/error_code": 1, "/plc/write": 2,
+    "/inspect": 20, "/inspect/frame": 10, "/inspect/finish": 20,
+    "/plc/events": (2, 30),     # read timeout > server SSE heartbeat
+    "/capabilities": 2,
+}
+TIMEOUTS.update(getattr(config, "HTTP_TIMEOUTS", {}))
+DEFAULT_TIMEOUT = 5
+
+# Sent with frames so the server keeps a detection prior per camera
+# (None = the server keys on this client's address)
+STATION_ID = getattr(config, "STATION_ID", None)
+
+def _make_session():
+    # Connect errors are retried for every method; read/status retries
+    # only for idempotent ones (urllib3 default excludes POST)
+    retry = Retry(total=HTTP_RETRIES, backoff_factor=HTTP_BACKOFF,
+                  status_forcelist=(502, 503, 504), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    s = requests.Session()
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+session = _make_session()
+
+_latency = {}   # path -> [calls, errors, total_s, max_s]
+_latency_lock = threading.Lock()
+
+def request(method, path, base_url=API_BASE_URL, **kwargs):
+    """session.request() with the per-endpoint timeout and latency accounting."""
+    kwargs.setdefault("timeout", TIMEOUTS.get(path, DEFAULT_TIMEOUT))
+    t0 = time.perf_counter()
+    ok = False
+    try:
+        r = session.request(method, f"{base_url}{path}", **kwargs)
+        ok = r.status_code < 500
+        return r
+    finally:
+        dt = time.perf_counter() - t0
+        with _latency_lock:
+            st = _latency.setdefault(path, [0, 0, 0.0, 0.0])
+            st[0] += 1
+            st[1] += 0 if ok else 1
+            st[2] += dt
+            st[3] = max(st[3], dt)
+
+def latency_stats():
+    """Per-endpoint call count, error count, mean and max latency (ms)."""
+    with _latency_lock:
+        return {
+            path: {"calls": n, "errors": err, "avg_ms": round(total / n * 1000, 2),
+                   "max_ms": round(mx * 1000, 2)}
+            for path, (n, err, total, mx) in _latency.items()
+        }
 
 def get_plc_input():
     try:
-        r = requests.get(f"{API_BASE_URL}/plc/input", timeout=1)
+        r = request("GET", "/plc/input")
         if r.status_code == 200:
             return r.json().get("status_input", 0)
     except: pass
     return 0
 
+# ----------------------------------------------------------------
+# frame encoding, negotiated once with the server's /capabilities
+# ----------------------------------------------------------------
+_codec = None
+
+def get_codec():
+    global _codec
+    if _codec is not None:
+        return _codec
+    try:
+        r = request("GET", "/capabilities")
+        # older servers have no /capabilities: they only take plain jpg
+        caps = r.json() if r.status_code == 200 else {"formats": ["jpg"]}
+        _codec = FrameCodec().negotiate(caps)
+        return _codec
+    except Exception:
+        return FrameCodec().negotiate({"formats": ["jpg"]})   # unreachable: retry next call
+
+def subscribe_triggers():
+    """Yields trigger events pushed on /plc/events; raises when the stream drops."""
+    with request("GET", "/plc/events", stream=True) as r:
+        r.raise_for_status()
+        for line in r.iter_lines(decode_unicode=True):
+            if line and line.startswith("data: "):
+                yield json.loads(line[6:])
+
 def get_pending_row():
     try:
-        r = requests.get(f"{API_BASE_URL}/plc/pending", timeout=1)
+        r = request("GET", "/plc/pending")
         if r.status_code == 200:
             return r.json() # Returns dict with 'created_at' or None
     except: pass
     return None
 
-def get_error_code():
+def get_error_code(created_at=None):
     try:
-        r = requests.get(f"{API_BASE_URL}/plc/error_code", timeout=1)
+        r = request("GET", "/plc/error_code", params={"created_at": created_at})
         return r.json().get("error_code", "ERROR-00000")
     except: return "ERROR-00000"
 
-def inspect_batch(frames, created_at, error_code):
+def inspect_batch(frames, created_at, error_code, originals=None):
+    codec = get_codec()
     files = []
-    for i, frame in enumerate(frames):
-        _, enc = cv2.imencode('.jpg', frame)
-        files.append(('files', (f'img_{i}.jpg', enc.tobytes(), 'image/jpeg')))
+    originals = originals or [None] * len(frames)
+    for i, (frame, original) in enumerate(zip(frames, originals)):
+        data, ext, mime = codec.encode(frame, original)
+        files.append(('files', (f'img_{i}.{ext}', data, mime)))
     
     try:
         # Send everything to server for processing
+        params = {"created_at": created_at, "error_code": error_code, "station": STATION_ID}
+        r = request("POST", "/inspect", files=files, params=params)
+        if r.status_code == 200:
+            return r.json()
+    except Exception as e:
+        print("Inspection Network Error:", e)
+    return None
+
+def inspect_frame(frame, created_at, total, original=None):
+    """Streams one frame; returns the server's running vote or None."""
+    data, ext, mime = get_codec().encode(frame, original)
+    files = {'file': (f'img.{ext}', data, mime)}
+    try:
+        params = {"created_at": created_at, "total": total, "station": STATION_ID}
+        r = request("POST", "/inspect/frame", files=files, params=params)
+        if r.status_code == 200:
+            return r.json()
+    except Exception as e:
+        print("Stream Frame Network Error:", e)
+    return None
+
+def finish_inspection(created_at, error_code):
+    """Closes a streamed inspection; same result shape as inspect_batch."""
+    try:
         params = {"created_at": created_at, "error_code": error_code}
-        r = requests.post(f"{API_BASE_URL}/inspect", files=files, params=params, timeout=20)
+        r = request("POST", "/inspect/finish", params=params)
         if r.status_code == 200:
             return r.json()
     except Exception as e:
@@ -50,6 +172,6 @@ def write_db_result(created_at, datecode, status, img_path, txt_path):
         "text_path": txt_path
     }
     try:
-        requests.post(f"{API_BASE_URL}/plc/write", json=payload, timeout=2)
+        request("POST", "/plc/write", json=payload)
     except Exception as e:
         print("DB Write Network Error:", e)
\ No newline at end of file
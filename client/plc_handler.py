@@ -1,5 +1,5 @@
 # client/plc_handler.py
-import requests
+import client.network as net
 from common.config import SERVER_IP, SERVER_PORT
 
 class PLCAPIHandler:
@@ -11,7 +11,7 @@ class PLCAPIHandler:
     def check_input_trigger(self):
         """Polls Server to check z_test_vision. Returns True on rising edge (0->1)."""
         try:
-            response = requests.get(f"{self.base_url}/plc/input", timeout=1)
+            response = net.request("GET", "/plc/input", base_url=self.base_url)
             if response.status_code == 200:
                 status = int(response.json().get("status_input", 0))
                 
@@ -30,7 +30,7 @@ class PLCAPIHandler:
     def get_pending_row(self):
         """Asks server for the row ID in z_par_plt waiting for result."""
         try:
-            response = requests.get(f"{self.base_url}/plc/pending", timeout=1)
+            response = net.request("GET", "/plc/pending", base_url=self.base_url)
             if response.status_code == 200:
                 return response.json() # Returns {'id': x, 'created_at': '...'}
         except Exception as e:
@@ -40,7 +40,7 @@ class PLCAPIHandler:
     def get_next_error_code(self):
         """Asks server for the next incremented ERROR-XXXXX string."""
         try:
-            response = requests.get(f"{self.base_url}/plc/error_code", timeout=1)
+            response = net.request("GET", "/plc/error_code", base_url=self.base_url)
             if response.status_code == 200:
                 return response.json().get("error_code")
         except:
@@ -56,7 +56,7 @@ class PLCAPIHandler:
             "text_path": text_path
         }
         try:
-            response = requests.post(f"{self.base_url}/plc/write", json=payload, timeout=2)
+            response = net.request("POST", "/plc/write", base_url=self.base_url, json=payload)
             return response.status_code == 200
         except Exception as e:
             print(f"Server Communication Error (Write): {e}")
@@ -0,0 +1,87 @@
+# client/prefilter.py
+import cv2
+import numpy as np
+import common.config as config
+
+PREFILTER_MIN_SHARPNESS = getattr(config, "PREFILTER_MIN_SHARPNESS", 40.0)    # variance of Laplacian
+PREFILTER_BRIGHTNESS    = getattr(config, "PREFILTER_BRIGHTNESS", (30, 225))  # accepted mean gray
+# Mean abs diff below this = the same camera frame read twice. Keep it under
+# sensor noise: a stopped battery gives near-identical frames that must still vote.
+PREFILTER_MIN_DIFF      = getattr(config, "PREFILTER_MIN_DIFF", 0.3)
+
+_PROBE_WIDTH = 320   # all gates run on a small grayscale copy
+
+
+class FrameGate:
+    """
+    Cheap client-side checks before a frame is uploaded: too dark/bright
+    (nothing in front of the camera), too blurred (battery still moving) or
+    the same camera frame read twice.
+    """
+    def __init__(self, min_sharpness=PREFILTER_MIN_SHARPNESS, brightness=PREFILTER_BRIGHTNESS,
+                 min_diff=PREFILTER_MIN_DIFF):
+        self.min_sharpness = min_sharpness
+        self.brightness = brightness
+        self.min_diff = min_diff
+        self.last_probe = None
+
+    def _probe(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        scale = _PROBE_WIDTH / gray.shape[1]
+        if scale < 1.0:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return gray
+
+    def measure(self, frame):
+        """(probe image, sharpness, brightness) for one frame."""
+        probe = self._probe(frame)
+        return probe, cv2.Laplacian(probe, cv2.CV_64F).var(), float(probe.mean())
+
+    def _passes(self, probe, sharpness, brightness, check_last=True):
+        lo, hi = self.brightness
+        if not lo <= brightness <= hi:
+            return False
+        if sharpness < self.min_sharpness:
+            return False
+        if check_last and self.last_probe is not None and self.last_probe.shape == probe.shape:
+            if float(cv2.absdiff(probe, self.last_probe).mean()) < self.min_diff:
+                return False
+        return True
+
+    def accept(self, frame):
+        """Streaming use: True if the frame is worth sending (and remembers it)."""
+        probe, sharpness, brightness = self.measure(frame)
+        if not self._passes(probe, sharpness, brightness):
+            return False
+        self.last_probe = probe
+        return True
+
+    def select(self, frames, count):
+        """
+        Burst use: the `count` sharpest frames that pass the gates, in capture
+        order. Falls back to the single sharpest frame if none pass, so the
+        server still gets something to archive.
+        """
+        return [frames[i] for i in self.pick(frames, count)]
+
+    def pick(self, frames, count):
+        """Indices of the frames select() would return."""
+        if not frames:
+            return []
+        measured = [self.measure(f) for f in frames]
+
+        # drop empty / blurred frames first, then rank by sharpness
+        candidates = [i for i, (p, s, b) in enumerate(measured) if self._passes(p, s, b, check_last=False)]
+        ranked = sorted(candidates, key=lambda i: measured[i][1], reverse=True)
+
+        picked = []
+        for i in ranked:
+            if len(picked) == count: break
+            # same camera frame as one already picked
+            if any(float(cv2.absdiff(measured[i][0], measured[j][0]).mean()) < self.min_diff for j in picked):
+                continue
+            picked.append(i)
+
+        if not picked:
+            picked = [int(np.argmax([s for _, s, _ in measured]))]
+        return sorted(picked)
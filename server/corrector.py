@@ -1,6 +1,8 @@
 # server/corrector.py
 from collections import Counter
 
+import numpy as np
+
 # ----------------------------------------------------------------
 # helper: mapping / reconstruction (kept exactly as in logic)
 # ----------------------------------------------------------------
@@ -15,79 +17,218 @@ MAPPING_D5 = {'A':['R','4'],'B':['D','O','Q','8'],'C':['E','Z','2']}
 MAPPING_D6 = {'1':['I','J'],'2':['Z'],'3':['E','B'],'4':['Y'],'5':['S'],'6':['G'],'7':['C']}
 MAPPING_D7 = {'D':['B','H','O','Q','U','0','8']}
 
+# ----------------------------------------------------------------
+# compiled lookup tables (built once at import)
+# _MAP_TABLE[pos][ord(c)] -> mapped char or "" ; positions 7-10 use D2
+# ----------------------------------------------------------------
+_POSITION_MAPPINGS = [MAPPING_D1, MAPPING_D2, MAPPING_D3, MAPPING_D4,
+                      MAPPING_D5, MAPPING_D6, MAPPING_D7,
+                      MAPPING_D2, MAPPING_D2, MAPPING_D2, MAPPING_D2]
+
+def _compile_position(mapping):
+    row = [""] * 256
+    # first key (in dict order) that claims a char wins, as in the old linear scan
+    for key, vals in mapping.items():
+        for ch in [key] + vals:
+            for c in {ch, ch.lower()}:
+                if not row[ord(c)]:
+                    row[ord(c)] = key
+    return tuple(row)
+
+_MAP_TABLE = tuple(_compile_position(m) for m in _POSITION_MAPPINGS)
+
+# same table as an 11x256 uint8 array for the vectorized path (0 = unmapped)
+_MAP_LUT = np.array([[ord(k) if k else 0 for k in row] for row in _MAP_TABLE], dtype=np.uint8)
+_POS_INDEX = np.arange(11)
+
+# ASCII punctuation/whitespace dropped by normalize() in one translate() call
+_DROP_NON_ALNUM = str.maketrans("", "", "".join(chr(i) for i in range(128) if not chr(i).isalnum()))
+
+# reconstruct_datecode switches to the numpy path from this many readings on
+VECTORIZE_MIN_READINGS = 256
+
 def map_by_position(c, pos):
-    c = c.upper()
-    mapping_sets = {
-        0: MAPPING_D1, 1: MAPPING_D2, 2: MAPPING_D3, 3: MAPPING_D4,
-        4: MAPPING_D5, 5: MAPPING_D6, 6: MAPPING_D7,
-    }
-    if pos in [7, 8, 9, 10]:
-        mapping_sets[pos] = MAPPING_D2
-
-    if pos in mapping_sets:
-        for key, vals in mapping_sets[pos].items():
-            if c == key or c in vals:
-                return key
-    return ""
+    if not 0 <= pos < 11: return ""
+    if len(c) != 1 or ord(c) > 255:
+        c = c.upper()
+        if len(c) != 1 or ord(c) > 255: return ""
+    return _MAP_TABLE[pos][ord(c)]
+
+def normalize(txt):
+    """Upper-case, alphanumeric-only, first 11 chars of a raw OCR string."""
+    if txt.isascii():
+        return txt.upper().translate(_DROP_NON_ALNUM)[:11]
+    return ''.join(k for k in txt.upper() if k.isalnum())[:11]
 
 def raw_digit_stats(list_raw):
     per_pos = [Counter() for _ in range(11)]
     for txt in list_raw:
-        t = ''.join(k for k in txt.upper() if k.isalnum())[:11]
-        for i, ch in enumerate(t):
+        for i, ch in enumerate(normalize(txt)):
             per_pos[i][ch] += 1
     return per_pos
 
+def _default_char(i):
+    if i == 0: return '1'
+    elif i == 6: return 'D'
+    elif i == 4: return 'A'
+    elif i == 5: return '1'
+    return '0'
+
+def _most_common(items):
+    """Counter(items).most_common(1)[0][0]: ties go to the earliest item."""
+    if len(items) > 16:
+        return Counter(items).most_common(1)[0][0]
+    return max(items, key=items.count)
+
 def reconstruct_datecode(list_raw):
     if not list_raw:
         return ""
+    if len(list_raw) >= VECTORIZE_MIN_READINGS:
+        result = _reconstruct_vectorized(list_raw)
+        if result is not None:
+            return result
 
-    raw_stats = raw_digit_stats(list_raw)
-    per_pos = [[] for _ in range(11)]
+    texts = [normalize(t) for t in list_raw]
+    result = ""
+    for i, table in enumerate(_MAP_TABLE):
+        column = [t[i] for t in texts if len(t) > i]
+        mapped = [table[ord(c)] if ord(c) < 256 else map_by_position(c, i) for c in column]
+        mapped = [m for m in mapped if m]
+        if mapped:
+            result += _most_common(mapped)
+        elif i in [7, 8, 9, 10] and column:
+            result += _most_common(column)
+        else:
+            result += _default_char(i)
+    return result
 
-    for txt in list_raw:
-        t = ''.join(k for k in txt.upper() if k.isalnum())
-        t = t[:11]
-        for i in range(len(t)):
-            mapped = map_by_position(t[i], i)
-            if mapped:
-                per_pos[i].append(mapped)
+def _majority(column):
+    """Most common non-zero code in a column; ties go to the earliest reading (as Counter does)."""
+    counts = np.bincount(column, minlength=256)
+    counts[0] = 0
+    top = counts.max()
+    if top == 0:
+        return None
+    candidates = np.flatnonzero(counts == top)
+    if len(candidates) > 1:
+        first_seen = [np.argmax(column == c) for c in candidates]
+        return chr(candidates[int(np.argmin(first_seen))])
+    return chr(candidates[0])
+
+def _reconstruct_vectorized(list_raw):
+    """reconstruct_datecode over many readings via the 11x256 LUT. None if not latin-1."""
+    try:
+        blob = "".join(normalize(t).ljust(11, "\0") for t in list_raw).encode("latin-1")
+    except UnicodeEncodeError:
+        return None
+    raw = np.frombuffer(blob, dtype=np.uint8).reshape(-1, 11)
+    mapped = _MAP_LUT[_POS_INDEX, raw]
 
     result = ""
     for i in range(11):
-        if per_pos[i]:
-            result += Counter(per_pos[i]).most_common(1)[0][0]
-        else:
-            if i in [7, 8, 9, 10] and raw_stats[i]:
-                result += raw_stats[i].most_common(1)[0][0]
-            elif i == 0: result += '1'
-            elif i == 6: result += 'D'
-            elif i == 4: result += 'A'
-            elif i == 5: result += '1'
-            else:
-                result += '0'
+        ch = _majority(mapped[:, i])
+        if ch is None and i in [7, 8, 9, 10]:
+            ch = _majority(raw[:, i])
+        result += ch if ch is not None else _default_char(i)
     return result
 
 def stats_digit(list_raw):
     per_pos = [Counter() for _ in range(11)]
     for txt in list_raw:
-        t = ''.join(k for k in txt.upper() if k.isalnum())[:11]
-        for i, ch in enumerate(t):
+        for i, ch in enumerate(normalize(txt)):
             mapped = map_by_position(ch, i)
             if mapped:
                 per_pos[i][mapped] += 1
     return per_pos
 
+MAJORITY_RULES = {
+    (5,): "VALID", (4,1): "VALID", (3,1,1): "VALID",
+    (3,2): "WARNING", (2,2,1): "WARNING", (2,1,1,1): "WARNING",
+    (1,1,1,1,1): "NO VALID", (4,): "VALID", (3,1): "VALID",
+    (2,2): "WARNING", (2,1,1): "WARNING", (1,1,1,1): "NO VALID",
+    (3,): "VALID", (2,1): "WARNING", (1,1,1): "NO VALID",
+    (2,): "WARNING", (1,1): "NO VALID", (1,): "NO VALID",
+}
+
 def majority_status(counter: Counter):
     if not counter: return "NO VALID"
     values = sorted(counter.values(), reverse=True)
     pattern = tuple(values)
-    rules = {
-        (5,): "VALID", (4,1): "VALID", (3,1,1): "VALID",
-        (3,2): "WARNING", (2,2,1): "WARNING", (2,1,1,1): "WARNING",
-        (1,1,1,1,1): "NO VALID", (4,): "VALID", (3,1): "VALID",
-        (2,2): "WARNING", (2,1,1): "WARNING", (1,1,1,1): "NO VALID",
-        (3,): "VALID", (2,1): "WARNING", (1,1,1): "NO VALID",
-        (2,): "WARNING", (1,1): "NO VALID", (1,): "NO VALID",
-    }
-    return rules.get(pattern, "NO VALID")
\ No newline at end of file
+    return MAJORITY_RULES.get(pattern, "NO VALID")
+
+# ----------------------------------------------------------------
+# single-pass voting: one normalize + map per reading
+# ----------------------------------------------------------------
+class DatecodeVote:
+    """
+    Accumulates the OCR readings of one cycle. Each raw string is normalized
+    and mapped once in add(); datecode(), status() and digit_stats() give the
+    same answers as reconstruct_datecode / majority_status / stats_digit over
+    raw_dates, read from the counters instead of re-scanning the readings.
+    """
+    def __init__(self, list_raw=()):
+        self.raw_dates = []                            # per-reading datecodes
+        self.counter = Counter()                       # datecode -> readings
+        self.per_pos = [Counter() for _ in range(11)]  # mapped chars per digit
+        self.raw_pos = [Counter() for _ in range(11)]  # all chars per digit
+        self._datecode = None
+        for raw in list_raw:
+            self.add(raw)
+
+    def add(self, raw):
+        """Votes one raw OCR string; returns its datecode (reconstruct_datecode([raw]))."""
+        t = normalize(raw)
+        code = ""
+        for i in range(11):
+            ch = t[i] if i < len(t) else ""
+            mapped = map_by_position(ch, i) if ch else ""
+            if mapped:
+                code += mapped
+            elif ch and i in [7, 8, 9, 10]:
+                code += ch
+            else:
+                code += _default_char(i)
+
+        self.raw_dates.append(code)
+        self.counter[code] += 1
+        for i, ch in enumerate(code):
+            self.raw_pos[i][ch] += 1
+            # unmapped chars here are raw fallbacks on digits 7-10
+            if _MAP_TABLE[i][ord(ch)] if ord(ch) < 256 else map_by_position(ch, i):
+                self.per_pos[i][ch] += 1
+        self._datecode = None
+        return code
+
+    def __len__(self):
+        return len(self.raw_dates)
+
+    def datecode(self):
+        if not self.raw_dates:
+            return ""
+        if self._datecode is None:
+            result = ""
+            for i in range(11):
+                if self.per_pos[i]:
+                    result += self.per_pos[i].most_common(1)[0][0]
+                elif i in [7, 8, 9, 10] and self.raw_pos[i]:
+                    result += self.raw_pos[i].most_common(1)[0][0]
+                else:
+                    result += _default_char(i)
+            self._datecode = result
+        return self._datecode
+
+    def status(self):
+        return majority_status(self.counter)
+
+    def settled(self, remaining):
+        """
+        True once the verdict is VALID and `remaining` more readings can no
+        longer catch the leading datecode, e.g. (3,) with 2 frames to go.
+        """
+        if self.status() != "VALID": return False
+        top = [c for _, c in self.counter.most_common(2)]
+        runner_up = top[1] if len(top) > 1 else 0
+        return top[0] > runner_up + max(0, remaining)
+
+    def digit_stats(self):
+        return self.per_pos
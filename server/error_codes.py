@@ -0,0 +1,119 @@
+# server/error_codes.py
+import heapq
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+STALE_LOCK_AGE = 30     # seconds before a leftover .lock file is considered dead
+
+
+@contextmanager
+def _file_lock(path, timeout=5.0):
+    """Cross-process lock via O_EXCL create (works on Windows and Linux)."""
+    lock = path + ".lock"
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock) > STALE_LOCK_AGE:
+                    os.remove(lock)
+                    continue
+            except OSError:
+                pass
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"could not lock {lock}")
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock)
+
+
+class ErrorCodeAllocator:
+    """
+    Hands out ERROR-xxxxx numbers from memory instead of scanning z_par_plt
+    every cycle. Seeded once from the highest number in the DB.
+
+    A number is tied to the cycle's created_at: asking again returns the same
+    code, and if the cycle ends with a real datecode the number goes back to
+    a free list, so successful cycles don't leave gaps in the sequence.
+
+    With seq_file set, several server processes share one high-water mark:
+    each reserves `block` numbers at a time under a file lock.
+    """
+    def __init__(self, seed, seq_file=None, block=50):
+        self._seed = seed           # () -> highest ERROR number already in the DB
+        self.seq_file = seq_file
+        self.block = block
+        self.lock = threading.Lock()
+        self.next = None            # next never-used number in the current block
+        self.limit = None           # end of current block (exclusive); None = unbounded
+        self.free = []              # released numbers, reused lowest first
+        self.assigned = OrderedDict()   # created_at -> number
+        try:
+            self._ensure_seeded()
+        except Exception as e:
+            print(f"⚠️ Error code seed deferred: {e}")
+
+    def _ensure_seeded(self):
+        if self.next is not None: return
+        base = self._seed() + 1
+        if self.seq_file:
+            self.next, self.limit = self._reserve_block(base)
+        else:
+            self.next, self.limit = base, None
+        print(f"✅ ERROR counter seeded at {self.next}")
+
+    def _reserve_block(self, floor):
+        with _file_lock(self.seq_file):
+            try:
+                with open(self.seq_file) as f:
+                    high = int(f.read().strip() or 0)
+            except (FileNotFoundError, ValueError):
+                high = 0
+            start = max(high + 1, floor)
+            with open(self.seq_file, "w") as f:
+                f.write(str(start + self.block - 1))
+        return start, start + self.block
+
+    def allocate(self, key=None):
+        with self.lock:
+            self._ensure_seeded()
+            if key is not None and key in self.assigned:
+                return self._format(self.assigned[key])
+
+            if self.free:
+                num = heapq.heappop(self.free)
+            else:
+                if self.limit is not None and self.next >= self.limit:
+                    self.next, self.limit = self._reserve_block(self.next)
+                num = self.next
+                self.next += 1
+
+            if key is not None:
+                self.assigned[key] = num
+                while len(self.assigned) > 256:     # forget cycles that never reported back
+                    self.assigned.popitem(last=False)
+            return self._format(num)
+
+    def release(self, key):
+        """Cycle ended with a real datecode: its number can be handed out again."""
+        with self.lock:
+            num = self.assigned.pop(key, None)
+            if num is not None:
+                heapq.heappush(self.free, num)
+
+    def confirm(self, key):
+        """Cycle's ERROR code was written to the DB: the number is used for good."""
+        with self.lock:
+            self.assigned.pop(key, None)
+
+    @staticmethod
+    def _format(num):
+        return f"ERROR-{num:05d}"
@@ -8,42 +8,99 @@ os.environ.pop("CUDA_VISIBLE_DEVICES", None)   # Remove any CPU-only override
 os.environ["CUDA_VISIBLE_DEVICES"] = "0"        # Use primary GPU (RTX 4090)
 os.environ["CUDA_LAUNCH_BLOCKING"] = "1"        # Easier CUDA error tracing during dev
 
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, Request
+from fastapi.responses import StreamingResponse
 import uvicorn
+import asyncio
+import json
+import threading
+import time
 import cv2
 import numpy as np
 import requests
-import tempfile
-from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime
+from typing import Optional
 
 # Local imports
-from common.config import SERVER_PORT, PHP_UPLOAD_URL, PHP_UPLOAD_TEXT_URL
+import common.config as config
+from common.config import SERVER_PORT, PHP_UPLOAD_URL, PHP_UPLOAD_TEXT_URL, PLC_SCAN_RATE
 from server.vision_engine import VisionEngine
+from server.worker_pool import VisionWorkerPool
+from server import yolo_backend
 from server.plc_handler import DatabaseHandler
-from server.corrector import reconstruct_datecode, majority_status, stats_digit
+from server.trigger_watcher import TriggerWatcher
+from server.outbox import UploadOutbox
+from server.corrector import DatecodeVote
 
-app = FastAPI()
+# Models and DB are created in the lifespan hook, not at import: spawned
+# vision workers re-import this module and must not load them twice.
+VISION_WORKERS    = getattr(config, "VISION_WORKERS", 0)   # 0 = in-process VisionEngine
+INFERENCE_WORKERS = getattr(config, "INFERENCE_WORKERS", max(2, VISION_WORKERS))
 
-# Initializing here ensures they respect the CUDA environment variables above.
-# VisionEngine and all torch/YOLO/OCR models will load onto the RTX 4090.
-print("🖥️  Starting Server in GPU mode — targeting NVIDIA RTX 4090 (CUDA:0)...")
+vision  = None
+db      = None
+watcher = None
+outbox  = None
 
-# Runtime CUDA availability check (informational, does not block startup)
-try:
-    import torch
-    if torch.cuda.is_available():
-        gpu_name = torch.cuda.get_device_name(0)
-        vram    = torch.cuda.get_device_properties(0).total_memory / (1024 ** 3)
-        print(f"✅ CUDA device detected : {gpu_name} ({vram:.1f} GB VRAM)")
+OUTBOX_DIR     = getattr(config, "OUTBOX_DIR", "outbox")
+OUTBOX_WORKERS = getattr(config, "OUTBOX_WORKERS", 2)
+# None: archive the client's original JPEG bytes as-is; int: re-encode at that quality
+ARCHIVE_JPEG_QUALITY = getattr(config, "ARCHIVE_JPEG_QUALITY", None)
+# Optional local audit copy of every received frame (original bytes, no re-encode)
+AUDIT_DIR = getattr(config, "AUDIT_DIR", None)
+
+SSE_HEARTBEAT = 15   # seconds between keep-alive comments on /plc/events
+
+# Blocking vision/upload work runs here so the event loop keeps serving /plc/*
+inference_pool = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+audit_pool     = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audit")
+
+@asynccontextmanager
+async def lifespan(app):
+    global vision, db, watcher, outbox
+
+    # Initializing here ensures they respect the CUDA environment variables above.
+    # VisionEngine and all torch/YOLO/OCR models will load onto the RTX 4090.
+    print("🖥️  Starting Server in GPU mode — targeting NVIDIA RTX 4090 (CUDA:0)...")
+
+    # Runtime CUDA availability check (informational, does not block startup)
+    try:
+        import torch
+        if torch.cuda.is_available():
+            gpu_name = torch.cuda.get_device_name(0)
+            vram    = torch.cuda.get_device_properties(0).total_memory / (1024 ** 3)
+            print(f"✅ CUDA device detected : {gpu_name} ({vram:.1f} GB VRAM)")
+        else:
+            print("⚠️  WARNING: CUDA is not available — falling back to CPU. "
+                  "Check CUDA / cuDNN installation and driver compatibility.")
+    except ImportError:
+        print("⚠️  torch not importable at startup check — skipping CUDA validation.")
+
+    if VISION_WORKERS > 0:
+        yolo_backend.prepare([config.MODEL_PATH, config.ROI_MODEL_PATH])
+        vision = VisionWorkerPool(VISION_WORKERS)
     else:
-        print("⚠️  WARNING: CUDA is not available — falling back to CPU. "
-              "Check CUDA / cuDNN installation and driver compatibility.")
-except ImportError:
-    print("⚠️  torch not importable at startup check — skipping CUDA validation.")
+        vision = VisionEngine()
+    db = DatabaseHandler()
+    watcher = TriggerWatcher(db, PLC_SCAN_RATE)
+    watcher.start()
+    outbox = UploadOutbox(
+        OUTBOX_DIR, {"image": upload_image_php, "text": upload_text_php},
+        patch_upload_path, workers=OUTBOX_WORKERS
+    )
+
+    yield
+
+    watcher.stop()
+    outbox.close()
+    inference_pool.shutdown(wait=False)
+    audit_pool.shutdown(wait=True)
+    if isinstance(vision, VisionWorkerPool):
+        vision.close()
 
-vision = VisionEngine()
-db     = DatabaseHandler()
+app = FastAPI(lifespan=lifespan)
 
 # --- PLC / DB ENDPOINTS ---
 @app.get("/plc/input")
@@ -51,14 +108,37 @@ def get_plc_input():
     """Client calls this loop to check 0->1 transition."""
     return {"status_input": db.get_current_input()}
 
+@app.get("/plc/events")
+async def plc_events(request: Request):
+    """SSE stream of server-detected 0->1 triggers (replaces polling /plc/input)."""
+    queue = watcher.subscribe()
+
+    async def stream():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT)
+                    yield f"data: {json.dumps(event)}\n\n"
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+        finally:
+            watcher.unsubscribe(queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
 @app.get("/plc/pending")
 def get_pending_row():
     """Client calls this to find where to write data."""
     return db.get_pending_row()
 
 @app.get("/plc/error_code")
-def get_new_error():
-    return {"error_code": db.get_next_error_code()}
+def get_new_error(created_at: Optional[str] = None):
+    return {"error_code": db.get_next_error_code(created_at)}
+
+@app.get("/plc/db_stats")
+def get_db_stats():
+    """Connection pool usage and wait-time metrics."""
+    return db.pool.stats()
 
 @app.post("/plc/write")
 def write_db(data: dict):
@@ -73,42 +153,97 @@ def write_db(data: dict):
     return {"success": success}
 
 # --- VISION & UPLOAD ENDPOINTS ---
+@app.get("/vision/workers")
+def get_vision_workers():
+    """Batches in flight per vision worker process (empty in single-engine mode)."""
+    depths = vision.queue_depths() if isinstance(vision, VisionWorkerPool) else []
+    return {"workers": len(depths), "queue_depth": depths}
+
+@app.get("/vision/timings")
+def get_vision_timings():
+    """Per-step time of the vision pipeline (cover, crop, roi, roi_prior, preprocess, ocr)."""
+    return vision.timing_stats()
+
+@app.get("/vision/cache")
+def get_vision_cache():
+    """Detection prior and OCR cache hits/misses, plus OCR time saved by the cache."""
+    stats = vision.counter_stats()
+    looked_up = stats.get("ocr_cache_hits", 0) + stats.get("ocr_cache_misses", 0)
+    if looked_up:
+        stats["ocr_cache_hit_rate"] = round(stats["ocr_cache_hits"] / looked_up, 3)
+    return stats
+
+# --- TRANSPORT NEGOTIATION ---
+def _decodable_formats():
+    probe = np.zeros((8, 8, 3), np.uint8)
+    formats = []
+    for ext in ("jpg", "png", "webp"):
+        try:
+            ok, enc = cv2.imencode(f".{ext}", probe)
+            if ok and cv2.imdecode(enc, cv2.IMREAD_COLOR) is not None:
+                formats.append(ext)
+        except cv2.error:
+            pass
+    return formats
+
+# Frames are decoded with IMREAD_COLOR, so grayscale, downscaled or cropped
+# uploads go through the same vision path as full colour frames.
+CAPABILITIES = {"formats": _decodable_formats(), "gray": True, "scale": True, "region": True}
+
+@app.get("/capabilities")
+def get_capabilities():
+    """Upload formats/options this server can decode (client picks its codec from it)."""
+    return CAPABILITIES
+
+@app.get("/outbox")
+def get_outbox_stats():
+    """Archive upload queue: pending, uploaded, retried and failed jobs."""
+    return outbox.stats()
+
 @app.post("/inspect")
-async def inspect_and_upload(files: list[UploadFile], created_at: str, error_code: str):
+async def inspect_and_upload(files: list[UploadFile], created_at: str, error_code: str,
+                             request: Request, station: Optional[str] = None):
     """
     1. Receives images
     2. Runs Vision (YOLO/OCR) on GPU (NVIDIA RTX 4090)
-    3. Uploads results to PHP
+    3. Queues the PHP uploads (outbox) and returns without waiting for them
     """
-    # Decode Images
-    frames = []
-    for file in files:
-        contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        if frame is not None:
-            frames.append(frame)
+    blobs = [await file.read() for file in files]
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_pool, run_inspection, blobs, created_at, error_code,
+                                      station_key(request, station))
+
+def station_key(request, station):
+    """Detection-cache key: the client's STATION_ID, else its address."""
+    return station or (request.client.host if request.client else None)
+
+def run_inspection(blobs, created_at, error_code, station=None):
+    """Blocking part of /inspect (decode -> vision -> queue upload), runs on inference_pool."""
+    frames, jpegs = decode_frames(blobs)
+    save_audit_copies(created_at, jpegs)
 
     # Run Vision
-    raw_dates = []
+    vote      = DatecodeVote()
     best_roi  = None
     last_frame = frames[-1] if frames else None
+    last_jpeg  = jpegs[-1] if jpegs else None
 
-    for frame in frames:
-        # VisionEngine is now running on CUDA (RTX 4090)
-        text, roi = vision.process_frame(frame)
+    # One batched Detect -> Crop -> OCR pass for the whole cycle
+    for text, roi in vision.process_batch(frames, station, created_at):
         if roi is not None: 
             best_roi = roi
         if text:
-            mapped = reconstruct_datecode([text])
-            if mapped: 
-                raw_dates.append(mapped)
+            vote.add(text)
 
+    return finish_inspection(vote, best_roi, last_frame, created_at, error_code, last_jpeg)
+
+def finish_inspection(vote, best_roi, last_frame, created_at, error_code, last_jpeg=None):
+    """Final verdict + queued PHP upload, shared by /inspect and /inspect/finish."""
     # Logic
-    counter = Counter(raw_dates)
+    raw_dates = vote.raw_dates
     if raw_dates:
-        final_dc = reconstruct_datecode(raw_dates)
-        status   = majority_status(counter)
+        final_dc = vote.datecode()
+        status   = vote.status()
         if not final_dc.strip():
             final_dc = error_code
             status   = "NO VALID"
@@ -116,51 +251,153 @@ async def inspect_and_upload(files: list[UploadFile], created_at: str, error_cod
         final_dc = error_code
         status   = "NO VALID"
 
-    # Upload to PHP
-    img_path = None
-    if best_roi is not None:
-        img_path = upload_image_php(last_frame, created_at, final_dc)
-    
-    txt_path = upload_text_php(created_at, final_dc, raw_dates)
+    # Queue PHP uploads; image_path/text_path are patched into the DB once they land
+    if best_roi is not None and last_frame is not None:
+        image = archive_jpeg(last_frame, last_jpeg)
+        if image is not None:
+            outbox.enqueue("image", created_at, final_dc, payload=image)
+
+    outbox.enqueue("text", created_at, final_dc, content=f"DATECODE: {final_dc}\nRAW: {raw_dates}")
 
     return {
         "datecode":    final_dc,
         "status":      status,
         "raw_dates":   raw_dates,
-        "stats_digit": stats_digit(raw_dates),
-        "image_path":  img_path,
-        "text_path":   txt_path
+        "stats_digit": vote.digit_stats(),
+        "image_path":  None,
+        "text_path":   None
     }
 
+# --- STREAMING INSPECTION ---
+# Client posts frames one by one while capturing (keyed by created_at) and
+# stops early once the running vote is settled, then calls /inspect/finish.
+STREAM_TTL = 60   # seconds before an unfinished stream is dropped
+
+streams      = {}
+streams_lock = threading.Lock()
+
+def get_stream(created_at):
+    now = time.monotonic()
+    with streams_lock:
+        for key in [k for k, st in streams.items() if now - st["started"] > STREAM_TTL]:
+            del streams[key]
+        if created_at not in streams:
+            streams[created_at] = {
+                "vote": DatecodeVote(), "frames": 0, "best_roi": None,
+                "last_frame": None, "last_jpeg": None, "started": now, "lock": threading.Lock()
+            }
+        return streams[created_at]
+
+@app.post("/inspect/frame")
+async def inspect_frame(file: UploadFile, created_at: str, total: int,
+                        request: Request, station: Optional[str] = None):
+    """Runs vision on one streamed frame and returns the running vote."""
+    blob = await file.read()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_pool, run_stream_frame, blob, created_at, total,
+                                      station_key(request, station))
+
+def run_stream_frame(blob, created_at, total, station=None):
+    stream = get_stream(created_at)
+    frames, jpegs = decode_frames([blob])
+    results = vision.process_batch(frames, station, created_at)
+
+    with stream["lock"]:
+        stream["frames"] += 1
+        if frames:
+            stream["last_frame"] = frames[0]
+            stream["last_jpeg"] = jpegs[0]
+            save_audit_copies(created_at, jpegs, first_index=stream["frames"] - 1)
+        for text, roi in results:
+            if roi is not None:
+                stream["best_roi"] = roi
+            if text:
+                stream["vote"].add(text)
+
+        vote = stream["vote"]
+        return {
+            "count":    len(vote),
+            "datecode": vote.datecode(),
+            "status":   vote.status(),
+            "settled":  vote.settled(total - stream["frames"])
+        }
+
+@app.post("/inspect/finish")
+async def finish_stream(created_at: str, error_code: str):
+    """Closes a stream: same response as /inspect for the frames received so far."""
+    with streams_lock:
+        stream = streams.pop(created_at, None)
+    if stream is None:
+        stream = {"vote": DatecodeVote(), "best_roi": None, "last_frame": None, "last_jpeg": None}
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        inference_pool, finish_inspection, stream["vote"], stream["best_roi"],
+        stream["last_frame"], created_at, error_code, stream["last_jpeg"]
+    )
+
 # --- HELPERS ---
-def upload_image_php(frame, created_at_str, datecode):
-    if frame is None: return None
-    fd, tmp = tempfile.mkstemp(suffix=".jpg")
-    os.close(fd)
-    try:
-        cv2.imwrite(tmp, frame)
-        with open(tmp, "rb") as f:
-            r = requests.post(PHP_UPLOAD_URL, files={"image": f},
-                data={"datecode": datecode, "created_at": created_at_str}, timeout=5)
-            if r.status_code == 200: 
-                return r.json().get("image_path")
-    except: 
-        pass
-    finally: 
-        if os.path.exists(tmp):
-            os.remove(tmp)
-    return None
-
-def upload_text_php(created_at_str, datecode, raw_dates):
-    content = f"DATECODE: {datecode}\nRAW: {raw_dates}"
+def decode_frames(blobs):
+    """Returns decoded frames and, aligned with them, the bytes they came from."""
+    frames, originals = [], []
+    for contents in blobs:
+        nparr = np.frombuffer(contents, np.uint8)
+        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        if frame is not None:
+            frames.append(frame)
+            originals.append(contents)
+    return frames, originals
+
+def save_audit_copies(created_at, jpegs, first_index=0):
+    """Writes the received bytes as-is under AUDIT_DIR/<day>/ on a background thread."""
+    if not AUDIT_DIR or not jpegs: return
+    audit_pool.submit(_write_audit_copies, created_at, jpegs, first_index)
+
+def _image_ext(data):
+    """File extension of encoded image bytes from their magic number; JPEG otherwise."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return "jpg"
+
+def _write_audit_copies(created_at, jpegs, first_index):
     try:
-        r = requests.post(PHP_UPLOAD_TEXT_URL, data={
-            "datecode": datecode, "created_at": created_at_str, "content": content}, timeout=5)
-        if r.status_code == 200: 
-            return r.json().get("text_path")
-    except: 
-        pass
-    return None
+        day_dir = os.path.join(AUDIT_DIR, datetime.now().strftime("%Y-%m-%d"))
+        os.makedirs(day_dir, exist_ok=True)
+        stem = "".join(c if c.isalnum() else "_" for c in created_at)
+        for i, data in enumerate(jpegs, start=first_index):
+            with open(os.path.join(day_dir, f"{stem}_{i}.{_image_ext(data)}"), "wb") as f:
+                f.write(data)
+    except Exception as e:
+        print(f"❌ Audit copy failed: {e}")
+
+def archive_jpeg(frame, original=None):
+    """JPEG bytes for the archive, in memory: the client's bytes when no re-encode is needed."""
+    if ARCHIVE_JPEG_QUALITY is None and original is not None and original[:2] == b"\xff\xd8":
+        return original
+    quality = 95 if ARCHIVE_JPEG_QUALITY is None else ARCHIVE_JPEG_QUALITY
+    ok, enc = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    return enc.tobytes() if ok else None
+
+def upload_image_php(job, image_bytes):
+    """Outbox uploader: raises on failure so the job is retried."""
+    r = requests.post(PHP_UPLOAD_URL, files={"image": ("image.jpg", image_bytes, "image/jpeg")},
+        data={"datecode": job["datecode"], "created_at": job["created_at"]}, timeout=5)
+    r.raise_for_status()
+    return r.json().get("image_path")
+
+def upload_text_php(job, payload):
+    r = requests.post(PHP_UPLOAD_TEXT_URL, data={
+        "datecode": job["datecode"], "created_at": job["created_at"],
+        "content": job["fields"]["content"]}, timeout=5)
+    r.raise_for_status()
+    return r.json().get("text_path")
+
+def patch_upload_path(job, path):
+    """Second phase of the write: fill in image_path / text_path only."""
+    if job["kind"] == "image":
+        return db.update_result(job["created_at"], None, None, path, None)
+    return db.update_result(job["created_at"], None, None, None, path)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=SERVER_PORT)
\ No newline at end of file
@@ -0,0 +1,76 @@
+# server/ocr_cache.py
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+_THUMB_SCALE = 3        # simple_preprocess upscales 2-3x: back to about the camera's pixels
+_MAX_SHIFT   = 2.0      # thumbnail px; a larger offset is a different view, not jitter
+_BORDER      = 2        # thumbnail px ignored at each edge after alignment
+
+
+def roi_hash(img):
+    """
+    (shape, thumbnail) key of a preprocessed grayscale ROI: a 1/3-scale
+    area-averaged float copy with its mean removed, so exposure drift
+    doesn't count.
+    """
+    h, w = img.shape[:2]
+    size = (max(w // _THUMB_SCALE, 2 * _BORDER + 1), max(h // _THUMB_SCALE, 2 * _BORDER + 1))
+    thumb = cv2.resize(img, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+    thumb -= thumb.mean()
+    return (h, w), thumb
+
+
+def roi_distance(a, b):
+    """
+    Largest per-pixel gray difference of two thumbnails after aligning b on a
+    (sub-pixel, by phase correlation), or None when the offset is too large
+    to be box jitter.
+    """
+    (sx, sy), _ = cv2.phaseCorrelate(b, a)
+    if abs(sx) > _MAX_SHIFT or abs(sy) > _MAX_SHIFT:
+        return None
+    shifted = cv2.warpAffine(b, np.float32([[1, 0, sx], [0, 1, sy]]), (b.shape[1], b.shape[0]),
+                             borderMode=cv2.BORDER_REPLICATE)
+    diff = np.abs(a - shifted)[_BORDER:-_BORDER, _BORDER:-_BORDER]
+    return float(diff.max())
+
+
+class OcrCache:
+    """
+    Bounded LRU of OCR results keyed by roi_hash. A lookup hits when an entry
+    of the same ROI shape, once aligned, differs by at most `tolerance` gray
+    levels at every thumbnail pixel. A changed box size is always a miss.
+
+    The worst pixel (not a bit count or mean) is compared on purpose: one
+    changed character moves some pixels a lot but barely moves the average.
+    Even so a single thin stroke can come close to the jitter of a stopped
+    battery, so a cache must only ever hold one battery's readings
+    (VisionEngine keeps one per station and cycle).
+    """
+    def __init__(self, size=64, tolerance=100):
+        self.size = size
+        self.tolerance = tolerance
+        self.entries = OrderedDict()    # id -> (shape, thumbnail, text, confidence)
+        self._ids = 0
+
+    def get(self, key):
+        shape, thumb = key
+        best, best_id = self.tolerance, None
+        for entry_id, (s, other, _, _) in self.entries.items():
+            if s != shape: continue
+            dist = roi_distance(other, thumb)
+            if dist is not None and dist <= best:
+                best, best_id = dist, entry_id
+        if best_id is None:
+            return None
+        self.entries.move_to_end(best_id)
+        _, _, text, conf = self.entries[best_id]
+        return text, conf
+
+    def put(self, key, text, conf):
+        self._ids += 1
+        self.entries[self._ids] = (key[0], key[1], text, conf)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
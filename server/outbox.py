@@ -0,0 +1,185 @@
+# server/outbox.py
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+
+class UploadOutbox:
+    """
+    Queue for the PHP archive uploads. /inspect only enqueues; worker threads
+    upload with retries and exponential backoff, then hand the resulting path
+    to on_uploaded (which patches it into z_par_plt).
+
+    Every job is recorded in `directory` as a small <id>.json at enqueue and
+    picked up again at start. Payload bytes stay in memory and are only
+    written (<id>.jpg) when the first attempt fails or on close(), so image
+    bytes never touch disk on the happy path; after a crash the job record
+    of a lost image survives and is moved to `directory`/failed. Jobs that
+    keep failing are moved there too.
+    """
+    def __init__(self, directory, uploaders, on_uploaded, workers=2,
+                 max_attempts=20, backoff=1.0, max_backoff=60.0):
+        self.directory = directory
+        self.failed_dir = os.path.join(directory, "failed")
+        os.makedirs(self.failed_dir, exist_ok=True)
+
+        self.uploaders = uploaders          # kind -> fn(job, payload bytes or None) -> remote path
+        self.on_uploaded = on_uploaded      # fn(job, remote path) -> bool
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.queue = queue.Queue()
+        self.memory = {}                    # job_id -> (job, payload) whose payload is not on disk
+        self.lock = threading.Lock()
+        self.counts = {"queued": 0, "uploaded": 0, "retries": 0, "failed": 0}
+        self.running = True
+
+        pending = sorted(f[:-5] for f in os.listdir(directory) if f.endswith(".json"))
+        for job_id in pending:
+            self.queue.put(job_id)
+        if pending:
+            print(f"📤 Outbox: resuming {len(pending)} pending upload(s)")
+
+        for i in range(workers):
+            threading.Thread(target=self._worker_loop, name=f"outbox-{i}", daemon=True).start()
+
+    # ---------------- paths ----------------
+    def _meta_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _payload_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.jpg")
+
+    def _save(self, job):
+        tmp = self._meta_path(job["id"]) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp, self._meta_path(job["id"]))
+
+    # ---------------- producer ----------------
+    def new_job_id(self):
+        return f"{time.time_ns()}_{uuid.uuid4().hex[:8]}"
+
+    def _spill(self, job, payload):
+        if payload is not None:
+            tmp = self._payload_path(job["id"]) + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(payload)
+            os.replace(tmp, self._payload_path(job["id"]))
+        self._save(job)
+
+    def enqueue(self, kind, created_at, datecode, payload=None, **fields):
+        """Records the job on disk and keeps payload (raw bytes to upload, e.g. JPEG) in memory."""
+        job = {
+            "id": self.new_job_id(), "kind": kind,
+            "created_at": created_at, "datecode": datecode,
+            "fields": fields, "attempts": 0, "remote_path": None,
+            "has_payload": payload is not None,
+        }
+        self._save(job)
+        with self.lock:
+            self.memory[job["id"]] = (job, payload)
+            self.counts["queued"] += 1
+        self.queue.put(job["id"])
+        return job["id"]
+
+    # ---------------- consumer ----------------
+    def _worker_loop(self):
+        while self.running:
+            try:
+                job_id = self.queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                job, payload = self._load(job_id)
+            except (OSError, ValueError) as e:
+                print(f"❌ Outbox: unreadable job {job_id}: {e}")
+                self._move_to_failed({"id": job_id})
+                with self.lock:
+                    self.counts["failed"] += 1
+                continue
+            self._process(job, payload)
+
+    def _load(self, job_id):
+        with self.lock:
+            if job_id in self.memory:
+                return self.memory[job_id]
+        with open(self._meta_path(job_id)) as f:
+            job = json.load(f)
+        payload = None
+        if os.path.exists(self._payload_path(job_id)):
+            with open(self._payload_path(job_id), "rb") as f:
+                payload = f.read()
+        elif job.get("has_payload") and not job["remote_path"]:
+            raise ValueError("payload lost (server stopped before it was written)")
+        return job, payload
+
+    def _process(self, job, payload):
+        try:
+            # Upload once; if only the DB patch failed, retry just the patch
+            if not job["remote_path"]:
+                path = self.uploaders[job["kind"]](job, payload)
+                if not path:
+                    raise RuntimeError("upload returned no path")
+                job["remote_path"] = path
+            if not self.on_uploaded(job, job["remote_path"]):
+                raise RuntimeError("DB path update failed")
+        except Exception as e:
+            self._retry(job, payload, e)
+            return
+
+        self._remove(job["id"])
+        with self.lock:
+            self.counts["uploaded"] += 1
+
+    def _retry(self, job, payload, error):
+        job["attempts"] += 1
+        # from here on the payload lives on disk too, so a restart doesn't lose it
+        self._spill(job, payload)
+        with self.lock:
+            self.memory.pop(job["id"], None)
+
+        if job["attempts"] >= self.max_attempts:
+            print(f"❌ Outbox: giving up on {job['kind']} {job['created_at']}: {error}")
+            self._move_to_failed(job)
+            with self.lock:
+                self.counts["failed"] += 1
+            return
+
+        delay = min(self.max_backoff, self.backoff * 2 ** (job["attempts"] - 1))
+        print(f"⚠️ Outbox: {job['kind']} upload failed ({error}), retry in {delay:.1f}s")
+        with self.lock:
+            self.counts["retries"] += 1
+        timer = threading.Timer(delay, self.queue.put, args=(job["id"],))
+        timer.daemon = True
+        timer.start()
+
+    def _remove(self, job_id):
+        with self.lock:
+            self.memory.pop(job_id, None)
+        for path in (self._meta_path(job_id), self._payload_path(job_id)):
+            try: os.remove(path)
+            except FileNotFoundError: pass
+
+    def _move_to_failed(self, job):
+        for path in (self._meta_path(job["id"]), self._payload_path(job["id"])):
+            if os.path.exists(path):
+                os.replace(path, os.path.join(self.failed_dir, os.path.basename(path)))
+
+    def stats(self):
+        with self.lock:
+            counts = dict(self.counts)
+        counts["pending"] = sum(1 for f in os.listdir(self.directory) if f.endswith(".json"))
+        return counts
+
+    def close(self):
+        """Stops the workers and writes the payloads still in memory so the next start resumes them."""
+        self.running = False
+        with self.lock:
+            pending, self.memory = list(self.memory.values()), {}
+        for job, payload in pending:
+            self._spill(job, payload)
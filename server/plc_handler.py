@@ -1,12 +1,152 @@
 # server/plc_handler.py
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
 import pyodbc
+import common.config as config
 from common.config import PLC_DB_SERVER, PLC_DB_DATABASE, PLC_DB_USERNAME, PLC_DB_PASSWORD
+from server.error_codes import ErrorCodeAllocator
+
+DB_POOL_SIZE       = getattr(config, "DB_POOL_SIZE", 4)
+DB_POOL_TIMEOUT    = getattr(config, "DB_POOL_TIMEOUT", 2.0)    # max wait for a free connection (s)
+DB_HEALTH_INTERVAL = getattr(config, "DB_HEALTH_INTERVAL", 30)  # idle connection check period (s)
+DB_RECONNECT_DELAY = 2.0
+
+# Shared high-water file for several server processes (None = single process)
+ERROR_SEQ_FILE  = getattr(config, "ERROR_SEQ_FILE", None)
+ERROR_SEQ_BLOCK = getattr(config, "ERROR_SEQ_BLOCK", 50)
+
+# Query-level errors: the connection itself is still fine
+_QUERY_ERRORS = (pyodbc.ProgrammingError, pyodbc.DataError, pyodbc.IntegrityError)
+
+class ConnectionPool:
+    """
+    Bounded pyodbc pool. Each request borrows a connection and gets its own cursor;
+    broken connections are replaced by a background thread, never inline.
+    """
+    def __init__(self, connect, size, timeout, health_interval):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.in_use = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self.reconnects = 0
+
+        for _ in range(size):
+            try:
+                self.idle.put(self._connect())
+            except Exception as e:
+                print(f"❌ DB Connect Failed: {e}")
+                self._replace()
+
+        self.health_interval = health_interval
+        threading.Thread(target=self._health_loop, daemon=True).start()
+
+    @contextmanager
+    def cursor(self):
+        conn = self._acquire()
+        broken = False
+        cur = None
+        try:
+            cur = conn.cursor()
+            yield cur
+        except _QUERY_ERRORS:
+            raise
+        except Exception:
+            broken = True
+            raise
+        finally:
+            if cur is not None:
+                try: cur.close()
+                except: broken = True
+            self._release(conn, broken)
+
+    def _acquire(self):
+        t0 = time.perf_counter()
+        try:
+            conn = self.idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self.lock:
+                self.timeouts += 1
+            raise RuntimeError(f"DB pool exhausted (waited {self.timeout}s)")
+        waited = time.perf_counter() - t0
+        with self.lock:
+            self.in_use += 1
+            self.waits += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        return conn
+
+    def _release(self, conn, broken=False):
+        with self.lock:
+            self.in_use -= 1
+        if broken:
+            try: conn.close()
+            except: pass
+            self._replace()
+        else:
+            self.idle.put(conn)
+
+    def _replace(self):
+        threading.Thread(target=self._reconnect_loop, daemon=True).start()
+
+    def _reconnect_loop(self):
+        while True:
+            try:
+                conn = self._connect()
+                with self.lock:
+                    self.reconnects += 1
+                self.idle.put(conn)
+                return
+            except Exception as e:
+                print(f"❌ DB Reconnect Failed: {e}")
+                time.sleep(DB_RECONNECT_DELAY)
+
+    def _health_loop(self):
+        while True:
+            time.sleep(self.health_interval)
+            # take every idle connection first: idle is LIFO, so putting one
+            # back before the next get would check the same connection again
+            sweep = []
+            while True:
+                try:
+                    sweep.append(self.idle.get_nowait())
+                except queue.Empty:
+                    break
+            for conn in sweep:
+                try:
+                    conn.execute("SELECT 1").fetchone()
+                    self.idle.put(conn)
+                except Exception:
+                    try: conn.close()
+                    except: pass
+                    self._replace()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": self.size,
+                "idle": self.idle.qsize(),
+                "in_use": self.in_use,
+                "acquired": self.waits,
+                "wait_avg_ms": round(self.wait_total / self.waits * 1000, 3) if self.waits else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+                "timeouts": self.timeouts,
+                "reconnects": self.reconnects,
+            }
 
 class DatabaseHandler:
     def __init__(self):
-        self.conn = self._connect()
-        self.cursor = self.conn.cursor()
-        print("✅ Server Database (SQL) Handler Initialized")
+        self.pool = ConnectionPool(self._connect, DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_HEALTH_INTERVAL)
+        self.error_codes = ErrorCodeAllocator(self._max_error_number, ERROR_SEQ_FILE, ERROR_SEQ_BLOCK)
+        print(f"✅ Server Database (SQL) Handler Initialized (pool of {DB_POOL_SIZE})")
 
     def _connect(self):
         return pyodbc.connect(
@@ -16,60 +156,75 @@ class DatabaseHandler:
             autocommit=True
         )
 
-    def _reconnect(self):
-        try:
-            self.conn = self._connect()
-            self.cursor = self.conn.cursor()
-        except Exception as e:
-            print(f"❌ DB Reconnect Failed: {e}")
-
     def get_current_input(self):
         """Selects current status from z_test_vision."""
         try:
-            self.cursor.execute("SELECT TOP 1 status_input FROM dbo.z_test_vision WITH (NOLOCK) ORDER BY created_at DESC")
-            row = self.cursor.fetchone()
-            return int(row[0]) if row else 0
+            with self.pool.cursor() as cur:
+                cur.execute("SELECT TOP 1 status_input FROM dbo.z_test_vision WITH (NOLOCK) ORDER BY created_at DESC")
+                row = cur.fetchone()
+                return int(row[0]) if row else 0
         except:
-            self._reconnect()
             return 0
 
     def get_pending_row(self):
         """Selects the most recent row that has no datecode yet."""
         try:
-            self.cursor.execute("""
-                SELECT TOP 1 id, created_at FROM dbo.z_par_plt WITH (NOLOCK)
-                WHERE datecode IS NULL ORDER BY created_at DESC
-            """)
-            row = self.cursor.fetchone()
+            with self.pool.cursor() as cur:
+                cur.execute("""
+                    SELECT TOP 1 id, created_at FROM dbo.z_par_plt WITH (NOLOCK)
+                    WHERE datecode IS NULL ORDER BY created_at DESC
+                """)
+                row = cur.fetchone()
             if row:
                 return {
-                    "id": row[0], 
+                    "id": row[0],
                     "created_at": row[1].strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
                 }
         except:
-            self._reconnect()
+            pass
         return None
 
-    def get_next_error_code(self):
-        """Calculates next Error sequence based on existing ERROR-XXXXX in DB."""
+    def _max_error_number(self):
+        """Highest ERROR-XXXXX in DB; only run when seeding the allocator."""
+        with self.pool.cursor() as cur:
+            # zero-padded to 5 digits but unbounded: longer codes are larger, so
+            # ERROR-100000 sorts above ERROR-99999
+            cur.execute("SELECT TOP 1 datecode FROM dbo.z_par_plt WITH (NOLOCK) WHERE datecode LIKE 'ERROR-%' "
+                        "ORDER BY LEN(datecode) DESC, datecode DESC")
+            row = cur.fetchone()
+        return int(row[0].split("-")[-1]) if row and row[0] else 0
+
+    def get_next_error_code(self, created_at=None):
+        """Next Error sequence from the in-memory allocator (same code per created_at)."""
         try:
-            self.cursor.execute("SELECT TOP 1 datecode FROM dbo.z_par_plt WITH (NOLOCK) WHERE datecode LIKE 'ERROR-%' ORDER BY created_at DESC")
-            row = self.cursor.fetchone()
-            num = int(row[0].split("-")[-1]) if row and row[0] else 0
-            return f"ERROR-{num + 1:05d}"
-        except:
+            return self.error_codes.allocate(created_at)
+        except Exception as e:
+            print(f"❌ Error Code Allocation Failed: {e}")
             return "ERROR-00001"
 
     def update_result(self, created_at, datecode, status, image_path, text_path):
-        """Performs the final SQL Update for a specific created_at timestamp."""
+        """
+        Performs the SQL Update for a specific created_at timestamp.
+        None leaves a column unchanged, so the outbox can patch paths
+        before or after the client writes datecode/status.
+        """
         try:
-            self.cursor.execute("""
-                UPDATE dbo.z_par_plt 
-                SET datecode = ?, status = ?, image_path = ?, text_path = ?
-                WHERE created_at BETWEEN DATEADD(ms,-900,?) AND DATEADD(ms, 900,?)
-            """, datecode, status, image_path, text_path, created_at, created_at)
+            with self.pool.cursor() as cur:
+                cur.execute("""
+                    UPDATE dbo.z_par_plt
+                    SET datecode   = COALESCE(?, datecode),
+                        status     = COALESCE(?, status),
+                        image_path = COALESCE(?, image_path),
+                        text_path  = COALESCE(?, text_path)
+                    WHERE created_at BETWEEN DATEADD(ms,-900,?) AND DATEADD(ms, 900,?)
+                """, datecode, status, image_path, text_path, created_at, created_at)
+            if datecode is None:
+                pass    # path-only patch
+            elif str(datecode).startswith("ERROR-"):
+                self.error_codes.confirm(created_at)
+            else:
+                self.error_codes.release(created_at)
             return True
         except Exception as e:
             print(f"❌ SQL Update Error: {e}")
-            self._reconnect()
-            return False
\ No newline at end of file
+            return False
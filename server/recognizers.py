@@ -0,0 +1,116 @@
+# server/recognizers.py
+import cv2
+import numpy as np
+
+import common.config as config
+
+# readtext = EasyOCR detector + recognizer (old behaviour)
+# recognize = EasyOCR recognizer only, on the whole ROI
+# ctc = OCR_CTC_MODEL (ONNX, CTC head over the allowlist) on the whole ROI
+OCR_MODE       = getattr(config, "OCR_MODE", "readtext")
+OCR_CTC_MODEL  = getattr(config, "OCR_CTC_MODEL", None)
+OCR_CTC_HEIGHT = getattr(config, "OCR_CTC_HEIGHT", 32)
+
+
+def make_recognizer(reader, allowlist, mode=OCR_MODE):
+    """Recognition-only backend for VisionEngine.read_batch, or None for readtext."""
+    if mode == "readtext":
+        return None
+    if mode == "recognize":
+        return EasyOCRRecognizer(reader, allowlist)
+    if mode == "ctc":
+        if not OCR_CTC_MODEL:
+            raise ValueError("OCR_MODE 'ctc' needs OCR_CTC_MODEL")
+        return CTCRecognizer(OCR_CTC_MODEL, allowlist)
+    raise ValueError(f"unknown OCR_MODE {mode!r}")
+
+
+class EasyOCRRecognizer:
+    """
+    EasyOCR's recognition network on whole ROIs. roi_model already localized
+    the datecode, so the CRAFT detection pass of readtext is skipped; all
+    ROIs of a cycle go through the recognizer as one batch.
+    """
+    def __init__(self, reader, allowlist):
+        from easyocr.recognition import get_text
+        from easyocr.utils import get_image_list
+        self._get_text = get_text
+        self._get_image_list = get_image_list
+        self.reader = reader
+        self.ignore_char = ''.join(set(reader.character) - set(allowlist))
+
+    def recognize(self, images):
+        """(text, confidence) per grayscale ROI; None entries give (None, 0.0)."""
+        out = [(None, 0.0)] * len(images)
+        idx = [i for i, img in enumerate(images) if img is not None and img.size]
+        if not idx: return out
+
+        # Same crop/resize as Reader.recognize with the whole image as one box
+        image_list, max_width = [], 0
+        for i in idx:
+            h, w = images[i].shape[:2]
+            crops, width = self._get_image_list([[0, w, 0, h]], [], images[i], model_height=self.reader.imgH)
+            image_list += crops
+            max_width = max(max_width, width)
+
+        r = self.reader
+        results = self._get_text(r.character, r.imgH, int(max_width), r.recognizer, r.converter,
+                                 image_list, ignore_char=self.ignore_char, decoder='greedy',
+                                 batch_size=len(image_list), workers=0, device=r.device)
+        for i, (_, text, conf) in zip(idx, results):
+            text = text.replace(" ", "")
+            out[i] = (text or None, float(conf))
+        return out
+
+
+class CTCRecognizer:
+    """
+    Any ONNX CRNN-style model with a CTC head: input (N, 1, H, W) gray
+    scaled to [-1, 1], output (N, T, len(alphabet) + 1) with blank = 0.
+    The alphabet is the OCR allowlist, so nothing else can be emitted.
+    """
+    def __init__(self, model_path, alphabet, height=OCR_CTC_HEIGHT):
+        import onnxruntime as ort
+        from server.yolo_backend import session_options
+        self.session = ort.InferenceSession(model_path, session_options(), providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.alphabet = alphabet
+        self.height = height
+
+    def _prepare(self, images):
+        resized = []
+        for img in images:
+            h, w = img.shape[:2]
+            width = max(self.height, int(round(w * self.height / h)))
+            resized.append(cv2.resize(img, (width, self.height), interpolation=cv2.INTER_AREA))
+        # pad right with the image mean so a batch shares one width
+        width = max(r.shape[1] for r in resized)
+        batch = np.empty((len(resized), 1, self.height, width), np.float32)
+        for b, r in zip(batch, resized):
+            b[0, :, :r.shape[1]] = r
+            b[0, :, r.shape[1]:] = r.mean()
+        return batch / 127.5 - 1.0
+
+    def _decode(self, logits):
+        """Greedy CTC: argmax per step, collapse repeats, drop blanks."""
+        probs = np.exp(logits - logits.max(-1, keepdims=True))
+        probs /= probs.sum(-1, keepdims=True)
+        best = probs.argmax(-1)
+        chars, scores, prev = [], [], 0
+        for t, k in enumerate(best):
+            if k != 0 and k != prev:
+                chars.append(self.alphabet[k - 1])
+                scores.append(probs[t, k])
+            prev = k
+        return "".join(chars), float(np.prod(scores)) if scores else 0.0
+
+    def recognize(self, images):
+        """(text, confidence) per grayscale ROI; None entries give (None, 0.0)."""
+        out = [(None, 0.0)] * len(images)
+        idx = [i for i, img in enumerate(images) if img is not None and img.size]
+        if not idx: return out
+        logits = self.session.run(None, {self.input_name: self._prepare([images[i] for i in idx])})[0]
+        for i, seq in zip(idx, logits):
+            text, conf = self._decode(seq)
+            out[i] = (text or None, conf)
+        return out
@@ -0,0 +1,75 @@
+# server/trigger_watcher.py
+import asyncio
+import threading
+import time
+from datetime import datetime
+
+
+class TriggerWatcher:
+    """
+    One z_test_vision poller for the whole server. Detects the 0->1 edge once
+    and pushes a trigger event (pending row + error code) to every client
+    subscribed to /plc/events, instead of each client polling /plc/input.
+    """
+    def __init__(self, db, scan_rate):
+        self.db = db
+        self.scan_rate = scan_rate
+        self.subscribers = set()    # (event loop, asyncio.Queue)
+        self.lock = threading.Lock()
+        self.last_status = None
+        self.running = False
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._watch_loop, daemon=True).start()
+        print("✅ PLC Trigger Watcher Started")
+
+    def stop(self):
+        self.running = False
+
+    def subscribe(self):
+        """Called from the event loop; returns the queue that receives trigger events."""
+        queue = asyncio.Queue(maxsize=16)
+        with self.lock:
+            self.subscribers.add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, queue):
+        with self.lock:
+            self.subscribers = {(l, q) for l, q in self.subscribers if q is not queue}
+
+    def _watch_loop(self):
+        while self.running:
+            with self.lock:
+                listening = bool(self.subscribers)
+
+            if not listening:
+                # nobody to notify: don't touch the DB, re-arm on next subscriber
+                self.last_status = None
+            else:
+                status = self.db.get_current_input()
+                if self.last_status == 0 and status == 1:
+                    print("⚡ Trigger Detected (0->1) -> Pushing to clients")
+                    pending = self.db.get_pending_row()
+                    self._publish({
+                        "event":      "trigger",
+                        "pending":    pending,
+                        "error_code": self.db.get_next_error_code(pending and pending["created_at"]),
+                        "ts":         datetime.now().isoformat(timespec="milliseconds"),
+                    })
+                self.last_status = status
+
+            time.sleep(self.scan_rate)
+
+    def _publish(self, event):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._offer, queue, event)
+
+    @staticmethod
+    def _offer(queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass    # client not reading; it will miss this trigger, not block the others
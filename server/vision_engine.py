@@ -1,51 +1,236 @@
 import cv2
 import easyocr
+import numpy as np
 import torch
 import os
-from ultralytics import YOLO
+import threading
+import time
+from contextlib import contextmanager
+import common.config as config
 from common.config import MODEL_PATH, ROI_MODEL_PATH
+from server.yolo_backend import load_yolo
+from server.recognizers import make_recognizer
+from server.ocr_cache import OcrCache, roi_hash
+
+OCR_ALLOWLIST = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+# Reuse each station's last cover box: later frames run only the ROI model
+# inside that box grown by PRIOR_MARGIN (per side); the cover model re-runs on a miss
+DETECTION_CACHE = getattr(config, "DETECTION_CACHE", False)
+PRIOR_MARGIN    = getattr(config, "PRIOR_MARGIN", 0.25)
+PRIOR_TTL       = getattr(config, "PRIOR_TTL", 300)     # seconds a prior stays valid
+
+# Reuse OCR results for near-identical preprocessed ROIs of one station's
+# cycle (stopped battery); tolerance = max gray-level difference per pixel
+# of the aligned ROI thumbnails (see OcrCache)
+OCR_CACHE           = getattr(config, "OCR_CACHE", False)
+OCR_CACHE_SIZE      = getattr(config, "OCR_CACHE_SIZE", 64)
+OCR_CACHE_TOLERANCE = getattr(config, "OCR_CACHE_TOLERANCE", 70)
+
+def pixel_boxes(xyxy, shape):
+    """Float (N, 4) xyxy -> int pixel boxes covering every partial pixel, clipped to the image."""
+    h, w = shape[:2]
+    boxes = np.empty(xyxy.shape, np.int64)
+    boxes[:, :2] = np.floor(xyxy[:, :2])
+    boxes[:, 2:] = np.ceil(xyxy[:, 2:])
+    boxes[:, 0::2] = np.clip(boxes[:, 0::2], 0, w)
+    boxes[:, 1::2] = np.clip(boxes[:, 1::2], 0, h)
+    return boxes
+
+def top_box(result, shape):
+    """Most confident box of one YOLO result as ints, or None. One device->host copy."""
+    if not len(result.boxes): return None
+    data = result.boxes.data.cpu().numpy()     # x1, y1, x2, y2, [track id,] conf, cls
+    k = int(data[:, -2].argmax())
+    return pixel_boxes(data[k:k + 1, :4], shape)[0]
 
 class VisionEngine:
     def __init__(self):
         print("⏳ Loading Models on CPU...")
         
-        # 1. Force YOLO to CPU
-        self.model = YOLO(MODEL_PATH).to('cpu')
-        self.roi_model = YOLO(ROI_MODEL_PATH).to('cpu')
+        # 1. YOLO on CPU (PyTorch, or ONNX Runtime with YOLO_BACKEND = "onnx")
+        self.model = load_yolo(MODEL_PATH)
+        self.roi_model = load_yolo(ROI_MODEL_PATH)
         
         # 2. Force EasyOCR to CPU
         self.reader = easyocr.Reader(['en'], gpu=False)
+        # Recognition-only path (OCR_MODE); None = readtext with detection
+        self.recognizer = make_recognizer(self.reader, OCR_ALLOWLIST)
+        self.ocr_cache = {} if OCR_CACHE else None     # station -> (cycle, OcrCache); None = off
+        self.ocr_ms = None      # running OCR cost per ROI, for the saved-time counter
+
+        # YOLO predictors and the EasyOCR reader are not thread-safe
+        self.lock = threading.Lock()
+
+        # Per-ROI preprocessing buffers, grown to the largest ROI seen and reused
+        self.gray_bufs = []
+        self.scaled_bufs = []
+        self.timing = {}        # step -> [calls, seconds]
+        self.counters = {}      # cache hit/miss counts
+        self.priors = {}        # station -> (cover box, frame shape, last seen)
         
         print("✅ Models Loaded (CPU Mode)")
 
     def process_frame(self, frame):
         """Main pipeline: Detect -> Crop -> OCR"""
         if frame is None: return None, None
-        
-        # Explicitly set device='cpu' and disable augment/half to keep it light
-        results = self.model(frame, verbose=False, device='cpu')
-        
-        for r in results:
-            for box in r.boxes:
-                text, roi = self.process_ocr(frame, box)
-                if text:
-                    return text, roi
-        return None, None
-
-    def get_datecode_roi(self, frame, box):
-        x1, y1, x2, y2 = map(int, box.xyxy[0])
-        crop = frame[y1:y2, x1:x2]
-        
-        # Use CPU for ROI model as well
-        res_roi = self.roi_model(crop, verbose=False, device='cpu')
-        for r in res_roi:
-            for b in r.boxes:
-                rx1, ry1, rx2, ry2 = map(int, b.xyxy[0])
-                return crop[ry1:ry2, rx1:rx2]
-        return None
-
-    def simple_preprocess(self, roi):
-        """Fixed: Thresholds increased to allow 900px+ images from your logs"""
+        return self.process_batch([frame])[0]
+
+    def process_batch(self, frames, station=None, cycle=None):
+        """
+        Batched pipeline for a whole capture cycle:
+        one cover pass over all frames, one ROI pass over all cover crops,
+        one OCR pass over all ROIs. Returns a (text, roi) tuple per frame.
+        With DETECTION_CACHE, frames of a station with a known stop position
+        skip the cover pass (see _process_batch). With OCR_CACHE, calls with
+        the same station and cycle (created_at) share OCR results.
+        """
+        with self.lock:
+            return self._process_batch(frames, station, cycle)
+
+    def _process_batch(self, frames, station=None, cycle=None):
+        outputs = [(None, None)] * len(frames)
+        idx = [i for i, f in enumerate(frames) if f is not None]
+        if not idx: return outputs
+
+        crops, owners, rois = [], [], []
+        window = None
+        if DETECTION_CACHE:
+            window = self._prior_window(station, frames[idx[0]].shape)
+            if window is None and len(idx) > 1:
+                # no prior yet: full detection on the first frame sets it for frames 2..N
+                crops, owners, rois = self._detect(frames, idx[:1], station)
+                window = self._prior_window(station, frames[idx[0]].shape)
+                idx = idx[1:]
+        if window is not None and idx:
+            # 1'. Battery stops where it did last time: ROI model inside the
+            # expanded prior cover box only; frames where it finds nothing,
+            # or only a box cut off by the window edge, fall through to the
+            # full cover pass
+            x1, y1, x2, y2 = window
+            with self._timed("roi_prior"):
+                wins = [frames[i][y1:y2, x1:x2] for i in idx]
+                misses = []
+                for i, win, r in zip(idx, wins, self.roi_model(wins, verbose=False, device='cpu')):
+                    box = top_box(r, win.shape)
+                    if box is None or self._at_border(box, win.shape):
+                        misses.append(i)
+                        continue
+                    crops.append(win)
+                    owners.append(i)
+                    rois.append(win[box[1]:box[3], box[0]:box[2]])
+            self._count("prior_hits", len(idx) - len(misses))
+            self._count("prior_misses", len(misses))
+            idx = misses
+
+        if idx:
+            full_crops, full_owners, full_rois = self._detect(frames, idx, station)
+            crops += full_crops
+            owners += full_owners
+            rois += full_rois
+        if not crops: return outputs
+
+        # 3. OCR on every preprocessed ROI at once
+        with self._timed("preprocess"):
+            prepped = [self.simple_preprocess(roi, k) for k, roi in enumerate(rois)]
+        with self._timed("ocr"):
+            texts = [text for text, _ in self.read_scored(prepped, self._cycle_cache(station, cycle))]
+
+        # First cover box (in detection order) that yields text wins
+        for i, text, roi in zip(owners, texts, rois):
+            if text and outputs[i][0] is None:
+                outputs[i] = (text, roi)
+        return outputs
+
+    def _detect(self, frames, idx, station=None):
+        """Full cover + ROI detection for frames[idx]: (crops, owners, rois)."""
+        # 1. Cover detection on the full frame list
+        with self._timed("cover"):
+            covers = self.model([frames[i] for i in idx], verbose=False, device='cpu')
+
+        with self._timed("crop"):
+            crops, owners, boxes = [], [], []
+            for i, r in zip(idx, covers):
+                # all boxes of a frame in one transfer, kept in detection order
+                for box in pixel_boxes(r.boxes.xyxy.cpu().numpy(), frames[i].shape):
+                    x1, y1, x2, y2 = box
+                    crop = frames[i][y1:y2, x1:x2]
+                    if crop.size:
+                        crops.append(crop)
+                        owners.append(i)
+                        boxes.append(box)
+        if not crops: return [], [], []
+
+        # 2. ROI detection on every cover crop at once, most confident ROI per crop
+        with self._timed("roi"):
+            rois = []
+            for crop, r in zip(crops, self.roi_model(crops, verbose=False, device='cpu')):
+                box = top_box(r, crop.shape)
+                rois.append(None if box is None else crop[box[1]:box[3], box[0]:box[2]])
+
+        if DETECTION_CACHE:
+            # remember the first cover box that contained a datecode ROI
+            for i, box, roi in zip(owners, boxes, rois):
+                if roi is not None:
+                    self.priors[station] = (box, frames[i].shape, time.monotonic())
+                    break
+        return crops, owners, rois
+
+    def _at_border(self, box, shape):
+        """True if an int box touches the edge of an image of `shape`, i.e. may be clipped."""
+        h, w = shape[:2]
+        return box[0] <= 0 or box[1] <= 0 or box[2] >= w or box[3] >= h
+
+    def _prior_window(self, station, shape):
+        """Last good cover box of the station grown by PRIOR_MARGIN, or None."""
+        prior = self.priors.get(station)
+        if prior is None: return None
+        box, prior_shape, seen = prior
+        if prior_shape != shape or time.monotonic() - seen > PRIOR_TTL:
+            del self.priors[station]
+            return None
+        x1, y1, x2, y2 = box
+        dx, dy = int((x2 - x1) * PRIOR_MARGIN), int((y2 - y1) * PRIOR_MARGIN)
+        h, w = shape[:2]
+        return max(0, x1 - dx), max(0, y1 - dy), min(w, x2 + dx), min(h, y2 + dy)
+
+    def _count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def _timed(self, step):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.timing.setdefault(step, [0, 0.0])
+            entry[0] += 1
+            entry[1] += time.perf_counter() - t0
+
+    def timing_stats(self):
+        """Per-step call count and average/total ms of the batched pipeline."""
+        return {step: {"calls": n, "avg_ms": round(t * 1000 / n, 3), "total_ms": round(t * 1000, 1)}
+                for step, (n, t) in self.timing.items()}
+
+    def counter_stats(self):
+        """Detection/OCR cache counters."""
+        return dict(self.counters)
+
+    def _buffer(self, pool, slot, h, w):
+        """(h, w) uint8 view into the slot's reusable buffer, growing it if needed."""
+        while len(pool) <= slot:
+            pool.append(np.empty((0, 0), np.uint8))
+        buf = pool[slot]
+        if buf.shape[0] < h or buf.shape[1] < w:
+            buf = pool[slot] = np.empty((max(h, buf.shape[0]), max(w, buf.shape[1])), np.uint8)
+        return buf[:h, :w]
+
+    def simple_preprocess(self, roi, slot=0):
+        """
+        Fixed: Thresholds increased to allow 900px+ images from your logs.
+        Gray and upscaled images are written into the slot's reusable
+        buffers: the result is valid until the slot is used again.
+        """
         if roi is None or roi.size == 0: return None
         h, w = roi.shape[:2]
         
@@ -55,24 +240,95 @@ class VisionEngine:
             return None
             
         try:
-            gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+            gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY, dst=self._buffer(self.gray_bufs, slot, h, w))
             # scale=2 is enough for CPU; 3 might slow down the laptop too much
             scale = 2 if w > 400 else 3
-            return cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+            out = self._buffer(self.scaled_bufs, slot, h * scale, w * scale)
+            return cv2.resize(gray, (w * scale, h * scale), dst=out, interpolation=cv2.INTER_CUBIC)
         except: 
             return None
 
-    def process_ocr(self, frame, box):
-        roi = self.get_datecode_roi(frame, box)
-        prepped = self.simple_preprocess(roi)
-        
-        if prepped is not None:
-            # Running EasyOCR on CPU
-            results = self.reader.readtext(
-                prepped, 
-                allowlist='ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
-            )
-            if results:
-                full_text = "".join([res[1] for res in results]).replace(" ", "")
-                return full_text, roi
-        return None, roi
\ No newline at end of file
+    def read_batch(self, images):
+        """Runs EasyOCR once over many preprocessed ROIs. None entries give None."""
+        return [text for text, _ in self.read_scored(images)]
+
+    def _cycle_cache(self, station, cycle):
+        """OcrCache of the station's current cycle; a new cycle drops the previous one."""
+        if self.ocr_cache is None or cycle is None: return None
+        entry = self.ocr_cache.get(station)
+        if entry is None or entry[0] != cycle:
+            entry = self.ocr_cache[station] = (cycle, OcrCache(OCR_CACHE_SIZE, OCR_CACHE_TOLERANCE))
+        return entry[1]
+
+    def read_scored(self, images, cache=None):
+        """
+        (text, confidence) per preprocessed ROI. With OCR_CACHE, ROIs close
+        to one in `cache` (one cycle's results) or to another ROI of the
+        same batch reuse its result and only the rest go through OCR.
+        """
+        if self.ocr_cache is None:
+            return self._ocr(images)
+
+        out = [(None, 0.0)] * len(images)
+        keys, todo, alias = {}, [], {}
+        batch = OcrCache(len(images), OCR_CACHE_TOLERANCE)     # duplicates within this batch
+        for i, img in enumerate(images):
+            if img is None: continue
+            keys[i] = roi_hash(img)
+            hit = cache.get(keys[i]) if cache is not None else None
+            if hit is not None:
+                out[i] = hit
+                continue
+            same = batch.get(keys[i])
+            if same is not None:
+                alias[i] = same[0]
+                continue
+            batch.put(keys[i], i, None)
+            todo.append(i)
+
+        if todo:
+            t0 = time.perf_counter()
+            for i, res in zip(todo, self._ocr([images[i] for i in todo])):
+                out[i] = res
+                if cache is not None:
+                    cache.put(keys[i], *res)
+            per_roi = (time.perf_counter() - t0) * 1000 / len(todo)
+            self.ocr_ms = per_roi if self.ocr_ms is None else 0.9 * self.ocr_ms + 0.1 * per_roi
+        for i, j in alias.items():
+            out[i] = out[j]
+
+        hits = len(keys) - len(todo)
+        self._count("ocr_cache_hits", hits)
+        self._count("ocr_cache_misses", len(todo))
+        if hits and self.ocr_ms is not None:
+            self._count("ocr_saved_ms", round(hits * self.ocr_ms, 1))
+        return out
+
+    def _ocr(self, images):
+        if self.recognizer is not None:
+            return self.recognizer.recognize(images)
+        scored = [(None, 0.0)] * len(images)
+        idx = [i for i, img in enumerate(images) if img is not None]
+        if not idx: return scored
+
+        # readtext_batched needs equal sizes: pad bottom/right instead of resizing
+        h = max(images[i].shape[0] for i in idx)
+        w = max(images[i].shape[1] for i in idx)
+        batch = [self._pad_to(images[i], h, w) for i in idx]
+
+        results = self.reader.readtext_batched(
+            batch,
+            allowlist=OCR_ALLOWLIST,
+            batch_size=len(batch)
+        )
+        for i, res in zip(idx, results):
+            if res:
+                text = "".join([r[1] for r in res]).replace(" ", "")
+                scored[i] = (text or None, float(min(r[2] for r in res)))
+        return scored
+
+    def _pad_to(self, img, h, w):
+        ph, pw = h - img.shape[0], w - img.shape[1]
+        if ph == 0 and pw == 0: return img
+        fill = int(cv2.mean(img)[0])
+        return cv2.copyMakeBorder(img, 0, ph, 0, pw, cv2.BORDER_CONSTANT, value=fill)
\ No newline at end of file
@@ -0,0 +1,216 @@
+# server/worker_pool.py
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import common.config as config
+
+# Upper bound on one process_batch call, so a wedged worker can't hang the request
+VISION_BATCH_TIMEOUT = getattr(config, "VISION_BATCH_TIMEOUT", 60)
+
+
+def _attach(name):
+    # Python 3.13+: don't let the worker's resource tracker unlink the parent's block
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+def _worker_main(idx, threads, tasks, results):
+    """Worker process: loads MODEL_PATH, ROI_MODEL_PATH and EasyOCR once, then serves batches."""
+    import torch
+    torch.set_num_threads(threads)
+
+    from server.vision_engine import VisionEngine
+    engine = VisionEngine()
+    results.put(("ready", idx, None))
+
+    while True:
+        task = tasks.get()
+        if task is None: break
+        task_id, shm_name, layout, station, cycle = task
+
+        shm = _attach(shm_name)
+        try:
+            # Copy out of the block: the YOLO predictor keeps references to its inputs
+            frames = [None if item is None else
+                      np.ndarray(item[1], np.uint8, buffer=shm.buf, offset=item[0]).copy()
+                      for item in layout]
+            out = engine.process_batch(frames, station, cycle)
+            results.put(("done", idx, (task_id, out, engine.timing_stats(), engine.counter_stats())))
+        except Exception as e:
+            results.put(("error", idx, (task_id, repr(e))))
+        finally:
+            shm.close()
+
+
+class VisionWorkerPool:
+    """
+    N VisionEngine processes behind the same process_batch() API as VisionEngine.
+    Frames travel through shared memory; each batch goes to the least busy worker.
+    """
+    def __init__(self, workers):
+        self.ctx = mp.get_context("spawn")
+        self.threads = max(1, (os.cpu_count() or 1) // workers)
+
+        self.results = self.ctx.Queue()
+        self.queues = [self.ctx.Queue() for _ in range(workers)]
+        self.procs = [self._process(i) for i in range(workers)]
+        self.depth = [0] * workers
+        self.timings = [{} for _ in range(workers)]     # last timing_stats() per worker
+        self.counters = [{} for _ in range(workers)]    # last counter_stats() per worker
+        self.affinity = {}      # station -> worker holding its detection prior
+        self.pending = {}       # task_id -> (future, shm, worker index)
+        self.lock = threading.Lock()
+        self._ids = itertools.count()
+        self.closing = False
+
+        print(f"⏳ Starting {workers} Vision Workers ({self.threads} threads each)...")
+        for p in self.procs:
+            p.start()
+        self._wait_ready()
+        print(f"✅ {workers} Vision Workers Ready")
+
+        self.collector = threading.Thread(target=self._collect_loop, daemon=True)
+        self.collector.start()
+
+    def _process(self, i):
+        return self.ctx.Process(target=_worker_main, args=(i, self.threads, self.queues[i], self.results),
+                                daemon=True)
+
+    def _wait_ready(self):
+        ready = 0
+        while ready < len(self.procs):
+            try:
+                kind, _, _ = self.results.get(timeout=5)
+                if kind == "ready": ready += 1
+            except Exception:
+                dead = [i for i, p in enumerate(self.procs) if not p.is_alive()]
+                if dead:
+                    self.close()
+                    raise RuntimeError(f"Vision worker(s) {dead} died while loading models")
+
+    def _collect_loop(self):
+        checked = time.monotonic()
+        while True:
+            try:
+                kind, _, payload = self.results.get(timeout=1)
+            except queue.Empty:
+                kind = None
+            if kind == "stop": break
+            if time.monotonic() - checked >= 1:
+                self._reap_dead()
+                checked = time.monotonic()
+            if kind not in ("done", "error"): continue     # timeout or a respawned worker's "ready"
+
+            task_id, out = payload[:2]
+            with self.lock:
+                entry = self.pending.pop(task_id, None)
+                if entry is None: continue      # already failed by _reap_dead
+                fut, shm, w = entry
+                self.depth[w] -= 1
+                if kind == "done":
+                    self.timings[w], self.counters[w] = payload[2], payload[3]
+            shm.close()
+            shm.unlink()
+            if kind == "done":
+                fut.set_result(out)
+            else:
+                fut.set_exception(RuntimeError(f"Vision worker {w}: {out}"))
+
+    def _reap_dead(self):
+        """Fails the batches of any crashed worker, frees their blocks and starts a replacement."""
+        for w, p in enumerate(self.procs):
+            if p.is_alive() or self.closing: continue
+            with self.lock:
+                lost = [task_id for task_id, (_, _, owner) in self.pending.items() if owner == w]
+                lost = [self.pending.pop(task_id)[:2] for task_id in lost]
+                self.depth[w] = 0
+                self.affinity = {st: i for st, i in self.affinity.items() if i != w}
+                self.queues[w] = self.ctx.Queue()
+                self.procs[w] = self._process(w)
+            print(f"⚠️ Vision worker {w} died (exit code {p.exitcode}), "
+                  f"failing {len(lost)} batch(es) and restarting it")
+            self.procs[w].start()
+            for fut, shm in lost:
+                shm.close()
+                shm.unlink()
+                fut.set_exception(RuntimeError(f"Vision worker {w} died"))
+
+    def submit(self, frames, station=None, cycle=None):
+        """
+        Queues a batch on the least busy worker, preferring the one that last
+        served `station` (it holds the station's detection prior) unless it
+        is busier. Returns a Future of process_batch output.
+        """
+        total = sum(f.nbytes for f in frames if f is not None)
+        shm = shared_memory.SharedMemory(create=True, size=max(total, 1))
+
+        layout, offset = [], 0
+        for f in frames:
+            if f is None:
+                layout.append(None)
+                continue
+            np.ndarray(f.shape, np.uint8, buffer=shm.buf, offset=offset)[...] = f
+            layout.append((offset, f.shape))
+            offset += f.nbytes
+
+        fut = Future()
+        with self.lock:
+            task_id = next(self._ids)
+            w = min(range(len(self.depth)), key=self.depth.__getitem__)
+            if station is not None:
+                last = self.affinity.get(station)
+                if last is not None and self.depth[last] <= self.depth[w]:
+                    w = last
+                self.affinity[station] = w
+            self.depth[w] += 1
+            self.pending[task_id] = (fut, shm, w)
+            # under the lock, so a respawn can't swap the queue after w was picked
+            self.queues[w].put((task_id, shm.name, layout, station, cycle))
+        return fut
+
+    def process_batch(self, frames, station=None, cycle=None):
+        return self.submit(frames, station, cycle).result(timeout=VISION_BATCH_TIMEOUT)
+
+    def queue_depths(self):
+        with self.lock:
+            return list(self.depth)
+
+    def timing_stats(self):
+        """VisionEngine.timing_stats() summed over the workers."""
+        merged = {}
+        with self.lock:
+            for stats in self.timings:
+                for step, s in stats.items():
+                    m = merged.setdefault(step, {"calls": 0, "total_ms": 0.0})
+                    m["calls"] += s["calls"]
+                    m["total_ms"] += s["total_ms"]
+        for m in merged.values():
+            m["avg_ms"] = round(m["total_ms"] / m["calls"], 3) if m["calls"] else 0.0
+            m["total_ms"] = round(m["total_ms"], 1)
+        return merged
+
+    def counter_stats(self):
+        """VisionEngine.counter_stats() summed over the workers."""
+        merged = {}
+        with self.lock:
+            for counters in self.counters:
+                for name, n in counters.items():
+                    merged[name] = merged.get(name, 0) + n
+        return merged
+
+    def close(self):
+        self.closing = True
+        for q in self.queues:
+            q.put(None)
+        self.results.put(("stop", None, None))
+        for p in self.procs:
+            p.join(timeout=5)
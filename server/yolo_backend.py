@@ -0,0 +1,100 @@
+# server/yolo_backend.py
+import os
+
+import numpy as np
+import torch
+from ultralytics import YOLO
+
+import common.config as config
+
+# torch = ultralytics .pt on CPU (old behaviour) | onnx = ONNX Runtime
+YOLO_BACKEND      = getattr(config, "YOLO_BACKEND", "torch")
+YOLO_ONNX_INT8    = getattr(config, "YOLO_ONNX_INT8", False)    # dynamic INT8 weights
+YOLO_ONNX_IMGSZ   = getattr(config, "YOLO_ONNX_IMGSZ", 640)
+# None = torch's thread count, so each vision worker keeps its share of cores
+ONNX_INTRA_THREADS = getattr(config, "ONNX_INTRA_THREADS", None)
+ONNX_INTER_THREADS = getattr(config, "ONNX_INTER_THREADS", 1)
+
+
+def load_yolo(weights, backend=YOLO_BACKEND, int8=YOLO_ONNX_INT8):
+    """
+    YOLO model for `weights` (.pt) on the configured backend. The ONNX file is
+    exported on first use and cached next to the weights (re-exported when the
+    .pt is newer); any export/load failure falls back to PyTorch.
+    """
+    if backend == "onnx":
+        try:
+            return _load_onnx(weights, int8)
+        except Exception as e:
+            print(f"⚠️ ONNX backend unavailable for {os.path.basename(weights)} ({e}), using PyTorch")
+    return YOLO(weights).to('cpu')
+
+
+def onnx_path(weights, int8=False):
+    base = os.path.splitext(weights)[0]
+    return base + (".int8.onnx" if int8 else ".onnx")
+
+
+def _stale(artifact, weights):
+    return not os.path.exists(artifact) or os.path.getmtime(artifact) < os.path.getmtime(weights)
+
+
+def export_onnx(weights, int8=False):
+    """Path of the cached ONNX export, creating it if missing or stale."""
+    fp32, target = onnx_path(weights), onnx_path(weights, int8)
+    if _stale(fp32, weights):
+        print(f"⏳ Exporting {os.path.basename(weights)} to ONNX...")
+        out = YOLO(weights).export(format="onnx", imgsz=YOLO_ONNX_IMGSZ, dynamic=True,
+                                   simplify=True, device="cpu")
+        if os.path.abspath(out) != os.path.abspath(fp32):
+            os.replace(out, fp32)
+    if int8 and _stale(target, fp32):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        print(f"⏳ Quantizing {os.path.basename(fp32)} to INT8...")
+        tmp = target + ".tmp"
+        quantize_dynamic(fp32, tmp, weight_type=QuantType.QUInt8)
+        os.replace(tmp, target)
+    return target
+
+
+def prepare(weights_list, backend=YOLO_BACKEND, int8=YOLO_ONNX_INT8):
+    """
+    Exports the ONNX artifacts up front, so vision worker processes started
+    afterwards only load them instead of racing to export. Failures are
+    left to load_yolo, which falls back per worker.
+    """
+    if backend != "onnx": return
+    for weights in weights_list:
+        try:
+            export_onnx(weights, int8)
+        except Exception as e:
+            print(f"⚠️ ONNX export failed for {os.path.basename(weights)}: {e}")
+
+
+def session_options():
+    import onnxruntime as ort
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = ONNX_INTRA_THREADS or torch.get_num_threads()
+    opts.inter_op_num_threads = ONNX_INTER_THREADS
+    if ONNX_INTER_THREADS > 1:
+        opts.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return opts
+
+
+def _load_onnx(weights, int8):
+    import onnxruntime as ort
+    path = export_onnx(weights, int8)
+    model = YOLO(path, task="detect")
+
+    # First call builds the predictor and its ORT session; swap that session
+    # for one with our thread settings.
+    model(np.zeros((YOLO_ONNX_IMGSZ, YOLO_ONNX_IMGSZ, 3), np.uint8), verbose=False, device='cpu')
+    backend = model.predictor.model
+    if not hasattr(backend, "session"):
+        raise RuntimeError("ultralytics backend exposes no ONNX session")
+    backend.session = ort.InferenceSession(path, session_options(), providers=["CPUExecutionProvider"])
+    opts = backend.session.get_session_options()
+    print(f"✅ {os.path.basename(path)} on ONNX Runtime "
+          f"(intra {opts.intra_op_num_threads}, inter {opts.inter_op_num_threads})")
+    return model